@@ -5,14 +5,16 @@ from .models import (
     Pet, ProdutoEmpresa, Favorito
 )
 from django.contrib import admin
-from .models import ParceriaOngEmpresa, ProdutoOngVinculo, Carrinho, ItemCarrinho, Pedido, ItemPedido
+from .models import ParceriaOngEmpresa, ProdutoOngVinculo, Carrinho, ItemCarrinho, Pedido, ItemPedido, ProcessamentoImagem
+from .imagens import url_derivado
 
 
 # helper p/ thumbnail
 def _thumb(obj, fieldname="imagem", size=56):
     f = getattr(obj, fieldname, None)
     if f:
-        return format_html('<img src="{}" style="width:{}px;height:{}px;object-fit:cover;border-radius:8px;">', f.url, size, size)
+        return format_html('<img src="{}" style="width:{}px;height:{}px;object-fit:cover;border-radius:8px;">',
+                           url_derivado(f, "mini"), size, size)
     return "—"
 
 # ---------- Inlines ----------
@@ -54,7 +56,7 @@ class UsuarioComumAdmin(admin.ModelAdmin):
 
 @admin.register(UsuarioEmpresarial)
 class UsuarioEmpresarialAdmin(admin.ModelAdmin):
-    list_display = ("razao_social", "cnpj", "user", "cidade", "qtd_produtos", "criado_em", "foto_prev")
+    list_display = ("razao_social", "cnpj", "user", "cidade", "qtd_produtos", "qtd_produtos_ativos", "criado_em", "foto_prev")
     search_fields = ("razao_social", "cnpj", "user__username", "cidade")
     list_filter = ("cidade", "criado_em")
     ordering = ("razao_social",)
@@ -62,14 +64,11 @@ class UsuarioEmpresarialAdmin(admin.ModelAdmin):
     readonly_fields = ("foto_prev",)
     fields = ("user", "razao_social", "cnpj", "telefone", "cidade", "foto", "foto_prev")
 
-    @admin.display(description="Produtos")
-    def qtd_produtos(self, obj): return obj.produtos.count()
-
     def foto_prev(self, obj): return _thumb(obj, "foto", 64)
 
 @admin.register(UsuarioOng)
 class UsuarioOngAdmin(admin.ModelAdmin):
-    list_display = ("nome_fantasia", "cnpj", "user", "cidade", "qtd_pets", "criado_em", "foto_prev")
+    list_display = ("nome_fantasia", "cnpj", "user", "cidade", "qtd_pets", "qtd_pets_disponiveis", "criado_em", "foto_prev")
     search_fields = ("nome_fantasia", "cnpj", "user__username", "cidade")
     list_filter = ("cidade", "criado_em")
     ordering = ("nome_fantasia",)
@@ -77,9 +76,6 @@ class UsuarioOngAdmin(admin.ModelAdmin):
     readonly_fields = ("foto_prev",)
     fields = ("user", "nome_fantasia", "cnpj", "telefone", "cidade", "site", "foto", "foto_prev")
 
-    @admin.display(description="Pets")
-    def qtd_pets(self, obj): return obj.pets.count()
-
     def foto_prev(self, obj): return _thumb(obj, "foto", 64)
 
 # ---------- Pets & Produtos ----------
@@ -161,4 +157,11 @@ class FavoritoAdmin(admin.ModelAdmin):
         elif obj.produto:
             return obj.produto.nome
         return "—"
-    nome_favorito.short_description = "Nome"
\ No newline at end of file
+    nome_favorito.short_description = "Nome"
+
+@admin.register(ProcessamentoImagem)
+class ProcessamentoImagemAdmin(admin.ModelAdmin):
+    list_display = ("nome", "modelo", "objeto_id", "status", "tentativas", "atualizado_em")
+    list_filter = ("status", "modelo")
+    search_fields = ("nome",)
+    readonly_fields = ("sha256", "erro", "criado_em", "atualizado_em")
@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class AmigofielConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'AmigoFiel'
+
+    def ready(self):
+        from django.conf import settings
+        from PIL import Image
+
+        from . import signals  # noqa: F401
+
+        # acima disso o Pillow avisa (e no dobro recusa) em vez de decodificar
+        Image.MAX_IMAGE_PIXELS = settings.IMAGENS_MAX_PIXELS
@@ -0,0 +1,57 @@
+# AmigoFiel/cache_home.py
+"""
+Cache por seção da home (pets, produtos, lojas, ONGs).
+
+Cada seção tem uma "versão" guardada no próprio cache; a chave dos dados
+inclui essa versão. Os signals (AmigoFiel/signals.py) só incrementam a
+versão — o conteúdo antigo expira sozinho — então invalidar é O(1) e funciona
+igual em LocMem, arquivos ou Redis.
+"""
+import time
+
+from django.core.cache import cache
+
+PREFIXO = "home"
+TIMEOUT = 60 * 15  # rede de segurança; a invalidação normal é pelos signals
+
+# Modelo alterado -> seções da home que dependem dele
+SECOES_POR_MODELO = {
+    "Pet": ("pets", "ongs"),                              # ongs: qtd_pets
+    "ProdutoEmpresa": ("produtos", "lojas"),              # lojas: qtd_produtos_ativos
+    "UsuarioEmpresarial": ("lojas", "produtos"),
+    "UsuarioOng": ("ongs",),
+}
+
+
+def _chave_versao(secao):
+    return f"{PREFIXO}:versao:{secao}"
+
+
+def versao(secao):
+    v = cache.get(_chave_versao(secao))
+    if v is None:
+        # começa de um valor "aleatório" para não reaproveitar dados de uma
+        # versão antiga caso a chave de versão tenha sido despejada do cache
+        v = int(time.time() * 1000)
+        cache.add(_chave_versao(secao), v, None)
+        v = cache.get(_chave_versao(secao), v)
+    return v
+
+
+def invalidar(*secoes):
+    for secao in secoes:
+        try:
+            cache.incr(_chave_versao(secao))
+        except ValueError:
+            # chave ainda não existe: a próxima leitura cria uma versão nova
+            pass
+
+
+def obter(secao, calcular, timeout=TIMEOUT):
+    """Retorna a lista da seção a partir do cache ou chama `calcular()` e guarda."""
+    chave = f"{PREFIXO}:{secao}:v{versao(secao)}"
+    dados = cache.get(chave)
+    if dados is None:
+        dados = list(calcular())
+        cache.set(chave, dados, timeout)
+    return dados
@@ -0,0 +1,87 @@
+# AmigoFiel/cartoes.py
+"""
+"Cartão de exibição" de usuários: nome, avatar, tipo e cidade — o que chat,
+inbox e menus precisam para mostrar alguém.
+
+Os cartões de vários usuários saem de uma query só (User + os três perfis
+via select_related) e ficam no cache; os signals (AmigoFiel/signals.py)
+apagam o cartão quando o usuário ou um perfil dele é salvo/removido.
+"""
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.templatetags.static import static
+
+PREFIXO = "cartao"
+TIMEOUT = 60 * 60 * 24
+
+# ordem de prioridade quando alguém tiver mais de um perfil
+_PERFIS = (
+    ("empresa", "perfil_empresa", "razao_social", "img/defaults/avatar_empresa.png"),
+    ("ong", "perfil_ong", "nome_fantasia", "img/defaults/avatar_ong.png"),
+    ("comum", "perfil_comum", None, "img/defaults/avatar_comum.png"),
+)
+
+
+def _chave(user_id):
+    return f"{PREFIXO}:{user_id}"
+
+
+def _montar(user):
+    card = {
+        "username": user.username,
+        "name": user.username,
+        "avatar_url": static("img/defaults/avatar_comum.png"),
+        "type": "comum",
+        "location": None,
+        "has_photo": False,
+        "perfis": [],
+    }
+    escolhido = False
+    for tipo, relacao, campo_nome, avatar_padrao in _PERFIS:
+        perfil = getattr(user, relacao, None)  # select_related: sem query extra
+        if perfil is None:
+            continue
+        card["perfis"].append(tipo)
+        if escolhido:
+            continue
+        escolhido = True
+        card["type"] = tipo
+        if campo_nome:
+            card["name"] = getattr(perfil, campo_nome) or user.username
+        card["location"] = perfil.cidade or None
+        card["has_photo"] = bool(perfil.foto)
+        card["avatar_url"] = perfil.foto.url if perfil.foto else static(avatar_padrao)
+    return card
+
+
+def cartoes(user_ids):
+    """{user_id: cartão} para vários usuários: cache primeiro, o resto numa query."""
+    user_ids = {uid for uid in user_ids if uid}
+    if not user_ids:
+        return {}
+    chaves = {_chave(uid): uid for uid in user_ids}
+    achados = cache.get_many(list(chaves))
+    resultado = {chaves[k]: v for k, v in achados.items()}
+
+    faltando = user_ids - resultado.keys()
+    if faltando:
+        User = get_user_model()
+        novos = {
+            u.pk: _montar(u)
+            for u in User.objects.filter(pk__in=faltando)
+                                 .select_related("perfil_empresa", "perfil_ong", "perfil_comum")
+        }
+        cache.set_many({_chave(uid): card for uid, card in novos.items()}, TIMEOUT)
+        resultado.update(novos)
+    return resultado
+
+
+def cartao(user):
+    """Cartão de um usuário (None para anônimo/inexistente)."""
+    if not getattr(user, "pk", None):
+        return None
+    return cartoes([user.pk]).get(user.pk)
+
+
+def invalidar(*user_ids):
+    cache.delete_many([_chave(uid) for uid in user_ids if uid])
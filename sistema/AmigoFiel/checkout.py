@@ -0,0 +1,144 @@
+# AmigoFiel/checkout.py
+"""
+Fechamento do pedido (checkout simulado).
+
+Tudo numa transação só: trava o carrinho (evita duplo envio), trava as linhas
+dos produtos sempre na mesma ordem (id) para que dois checkouts concorrentes
+não entrem em deadlock, baixa o estoque com um UPDATE condicional
+(``estoque >= quantidade``), grava os itens com ``bulk_create`` e calcula os
+totais em Python a partir das linhas montadas — sem reagregar no banco.
+Na mesma transação acumula o rollup diário (VendaDiaria) dos painéis.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, Q, When
+from django.utils import timezone
+
+from .models import Carrinho, ItemPedido, Pedido, ProdutoEmpresa, ProdutoOngVinculo, VendaDiaria
+
+CENTAVOS = Decimal("0.01")
+
+
+class CarrinhoVazio(Exception):
+    pass
+
+
+class EstoqueInsuficiente(Exception):
+    """Algum produto não tem estoque para a quantidade pedida."""
+
+    def __init__(self, produtos):
+        self.produtos = produtos  # lista de ProdutoEmpresa sem estoque suficiente
+        super().__init__(", ".join(p.nome for p in produtos))
+
+
+def doacoes_por_produto(produtos):
+    """
+    Resolve, para vários produtos de uma vez, o vínculo ativo de maior percentual:
+    {produto_id: (ong, percentual)}. Usa o prefetch de vinculos_ong quando houver;
+    senão faz uma única query (DISTINCT ON produto_id).
+    """
+    resultado = {}
+    faltando = []
+    for produto in produtos:
+        prefetch = getattr(produto, "_prefetched_objects_cache", {})
+        if "vinculos_ong" in prefetch:
+            ativos = [v for v in prefetch["vinculos_ong"] if v.ativo]
+            melhor = max(ativos, key=lambda v: v.percentual, default=None)
+            if melhor:
+                resultado[produto.pk] = (melhor.ong, melhor.percentual)
+        else:
+            faltando.append(produto.pk)
+
+    if faltando:
+        vinculos = (ProdutoOngVinculo.objects
+                    .filter(produto_id__in=faltando, ativo=True)
+                    .select_related("ong")
+                    .order_by("produto_id", "-percentual")
+                    .distinct("produto_id"))
+        for vinc in vinculos:
+            resultado[vinc.produto_id] = (vinc.ong, vinc.percentual)
+
+    # sem vínculo: nenhum % (poderia herdar Parceria se quiser evoluir)
+    return {p.pk: resultado.get(p.pk, (None, Decimal("0.00"))) for p in produtos}
+
+
+def _baixar_estoque(quantidades):
+    """
+    Um único UPDATE para todos os produtos. A condição ``estoque >= qtd`` vai
+    no WHERE de cada linha: se alguma não casar, o rowcount denuncia.
+    """
+    condicao = Q()
+    for pid, qtd in quantidades.items():
+        condicao |= Q(pk=pid, estoque__gte=qtd)
+    atualizados = ProdutoEmpresa.objects.filter(condicao).update(
+        estoque=Case(
+            *[When(pk=pid, then=F("estoque") - qtd) for pid, qtd in quantidades.items()],
+            default=F("estoque"),
+            output_field=PositiveIntegerField(),
+        )
+    )
+    return atualizados == len(quantidades)
+
+
+def finalizar_pedido(user, cart):
+    """
+    Converte o carrinho em Pedido. Levanta CarrinhoVazio ou EstoqueInsuficiente
+    (nesse caso nada é gravado).
+    """
+    with transaction.atomic():
+        Carrinho.objects.select_for_update().filter(pk=cart.pk).first()
+
+        quantidades = dict(cart.itens.values_list("produto_id", "quantidade"))
+        if not quantidades:
+            raise CarrinhoVazio()
+
+        # trava em ordem determinística; of=("self",) para não travar a empresa
+        produtos = list(ProdutoEmpresa.objects
+                        .select_for_update(of=("self",))
+                        .select_related("empresa")
+                        .filter(pk__in=quantidades)
+                        .order_by("pk"))
+
+        sem_estoque = [p for p in produtos if p.estoque < quantidades[p.pk]]
+        if sem_estoque:
+            raise EstoqueInsuficiente(sem_estoque)
+        if not _baixar_estoque(quantidades):
+            # não deveria acontecer com as linhas travadas, mas o WHERE é a garantia
+            raise EstoqueInsuficiente(produtos)
+
+        doacoes = doacoes_por_produto(produtos)
+        novos = []
+        total_bruto = Decimal("0.00")
+        total_doacao = Decimal("0.00")
+        for produto in produtos:
+            qtd = quantidades[produto.pk]
+            ong, perc = doacoes[produto.pk]
+            punit = produto.preco or Decimal("0.00")
+            total = (punit * qtd).quantize(CENTAVOS)
+            valor_doacao = (total * perc / Decimal("100")).quantize(CENTAVOS)
+            total_bruto += total
+            total_doacao += valor_doacao
+            novos.append(ItemPedido(
+                produto=produto,
+                empresa=produto.empresa,
+                ong=ong,
+                quantidade=qtd,
+                preco_unitario=punit,
+                total=total,
+                percentual_doacao=perc,
+                valor_doacao=valor_doacao,
+            ))
+
+        pedido = Pedido.objects.create(
+            user=user, status="pago",
+            total_bruto=total_bruto, total_doacao=total_doacao,
+        )
+        for item in novos:
+            item.pedido = pedido
+        ItemPedido.objects.bulk_create(novos)
+        # rollup dos painéis: mesmo dia (fuso local) que TruncDate daria ao criado_em
+        VendaDiaria.objects.acumular(novos, timezone.localdate(novos[0].criado_em))
+
+        cart.itens.all().delete()  # limpa carrinho
+    return pedido
@@ -1,8 +1,14 @@
 # AmigoFiel/context_processors.py
+from .cartoes import cartao
+
+
 def perfis_flags(request):
-    u = request.user
+    # cartão em cache: nenhuma query de perfil por render
+    card = cartao(request.user) if request.user.is_authenticated else None
+    perfis = card["perfis"] if card else ()
     return {
-        "eh_empresa": hasattr(u, "perfil_empresa"),
-        "eh_comum": hasattr(u, "perfil_comum"),
-        "eh_ong": hasattr(u, "perfil_ong"),
+        "meu_cartao": card,
+        "eh_empresa": "empresa" in perfis,
+        "eh_comum": "comum" in perfis,
+        "eh_ong": "ong" in perfis,
     }
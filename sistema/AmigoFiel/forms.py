@@ -1,7 +1,11 @@
 from django import forms
+from django.conf import settings
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
+from django.template.defaultfilters import filesizeformat
+from PIL import Image
 import re
+from .imagens import reduzir_upload
 from .models import ProdutoEmpresa, Pet, UsuarioOng
 
 
@@ -13,6 +17,54 @@ TIPOS = (##tipos de usuários
 
 CNPJ_REGEX = re.compile(r"^\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2}$|^\d{14}$") ##regex para validar cnpj
 
+
+class ImagemLimitadaField(forms.ImageField):
+    """
+    ImageField que recusa o upload antes de decodificar: primeiro pelo tamanho
+    do arquivo, depois pelos megapixels lidos só do cabeçalho (Image.open é
+    preguiçoso). Uploads grandes chegam como arquivo temporário em disco
+    (FILE_UPLOAD_MAX_MEMORY_SIZE) e são lidos de lá, sem cópia em memória.
+    """
+    reduzir = False  # True: grava já reduzido a IMAGENS_UPLOAD_LADO_MAXIMO
+
+    def to_python(self, data):
+        if data in self.empty_values:
+            return super().to_python(data)
+
+        max_bytes = settings.IMAGENS_MAX_BYTES
+        if data.size > max_bytes:
+            raise forms.ValidationError(
+                f"Imagem muito grande ({filesizeformat(data.size)}). O máximo é {filesizeformat(max_bytes)}.",
+                code="imagem_grande",
+            )
+
+        origem = data.temporary_file_path() if hasattr(data, "temporary_file_path") else data
+        try:
+            with Image.open(origem) as img:
+                largura, altura = img.size
+        except Image.DecompressionBombError:
+            largura = altura = None
+        except OSError:
+            largura = altura = 0  # não é imagem: o ImageField do Django dá a mensagem
+        finally:
+            if hasattr(data, "seek"):
+                data.seek(0)
+        if largura is None or largura * altura > settings.IMAGENS_MAX_PIXELS:
+            raise forms.ValidationError(
+                f"Imagem com resolução grande demais. O máximo é "
+                f"{settings.IMAGENS_MAX_PIXELS / 1e6:.0f} megapixels.",
+                code="imagem_pixels",
+            )
+
+        f = super().to_python(data)
+        if self.reduzir:
+            f = reduzir_upload(f, settings.IMAGENS_UPLOAD_LADO_MAXIMO)
+        return f
+
+
+class ImagemReduzidaField(ImagemLimitadaField):
+    reduzir = True
+
 class CadastroForm(UserCreationForm): ##formulário de cadastro de usuários
     user_type = forms.ChoiceField(choices=TIPOS, label="Tipo de conta")
 
@@ -105,6 +157,7 @@ class ProdutoForm(forms.ModelForm): ##formulário para produtos de empresas
             "nome", "categoria", "descricao_curta", "descricao", 
             "preco", "desconto_percentual", "estoque", "ativo", "imagem"
         ]
+        field_classes = {"imagem": ImagemReduzidaField}
         widgets = {
             "descricao": forms.Textarea(attrs={"rows": 5, "placeholder": "Descrição detalhada do produto..."}),
             "descricao_curta": forms.TextInput(attrs={"placeholder": "Breve descrição (máx. 200 caracteres)"}),
@@ -169,6 +222,7 @@ class PetForm(forms.ModelForm):     ##formulário para cadastro de pets
             "nome", "especie", "raca", "idade_anos", "sexo",
             "castrado", "vacinado", "descricao", "imagem",
         ]
+        field_classes = {"imagem": ImagemReduzidaField}
         widgets = {
             "nome": forms.TextInput(attrs={"placeholder": "Ex: Luna, Thor, Mimi..."}),
             "raca": forms.TextInput(attrs={"placeholder": "Ex: Vira-lata, SRD, Golden Retriever..."}),
@@ -215,6 +269,7 @@ class PerfilComumEditForm(forms.ModelForm):
     class Meta:
         model = UsuarioComum
         fields = ["telefone", "cidade", "estado", "cep", "foto"]
+        field_classes = {"foto": ImagemLimitadaField}
         widgets = {
             "telefone": forms.TextInput(attrs={"placeholder": "Ex: (11) 98765-4321"}),
             "cidade": forms.TextInput(attrs={"placeholder": "Ex: São Paulo"}),
@@ -244,6 +299,7 @@ class PerfilEmpresaEditForm(forms.ModelForm):
     class Meta:
         model = UsuarioEmpresarial
         fields = ["razao_social", "cnpj", "telefone", "cidade", "cep", "foto", "banner", "slogan"]
+        field_classes = {"foto": ImagemLimitadaField, "banner": ImagemLimitadaField}
         widgets = {
             "razao_social": forms.TextInput(attrs={"placeholder": "Nome da empresa"}),
             "cnpj": forms.TextInput(attrs={"placeholder": "00.000.000/0000-00"}),
@@ -293,6 +349,7 @@ class PerfilOngEditForm(forms.ModelForm):
     class Meta:
         model = UsuarioOng
         fields = ["nome_fantasia", "cnpj", "telefone", "cidade", "estado", "cep", "site", "foto", "banner", "slogan"]
+        field_classes = {"foto": ImagemLimitadaField, "banner": ImagemLimitadaField}
         widgets = {
             "nome_fantasia": forms.TextInput(attrs={"placeholder": "Nome da ONG"}),
             "cnpj": forms.TextInput(attrs={"placeholder": "00.000.000/0000-00"}),
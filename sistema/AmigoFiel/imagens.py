@@ -0,0 +1,306 @@
+# AmigoFiel/imagens.py
+"""
+Derivados de imagem: versões reduzidas e recomprimidas dos uploads.
+
+Os templates pedem um tamanho nomeado (``settings.IMAGENS_TAMANHOS``) e
+recebem a URL de um arquivo em ``derivados/``, nomeado pelo SHA-256 do
+original + o lado em px (``derivados/ab/<hash>_600.webp``). Mesmo conteúdo,
+mesmo derivado — não importa quantas linhas apontem para ele — e o nome
+nunca muda de conteúdo, então pode ser cacheado para sempre pelo navegador.
+
+Nada disso roda na requisição: o save registra o arquivo em
+ProcessamentoImagem e o worker (``manage.py processar_imagens``) valida,
+reduz o original grande demais e gera os derivados. Enquanto isso a tag
+``miniatura`` devolve um placeholder; o estado "arquivo -> SHA-256" de cada
+original fica no cache.
+"""
+import hashlib
+import logging
+import os
+from datetime import timedelta
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.templatetags.static import static
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+
+from . import cache_home, cartoes
+from .models import CAMPOS_DE_ARQUIVO, ArquivoMidia
+from .storage import sha256_do_nome
+
+logger = logging.getLogger(__name__)
+
+PREFIXO = "img"
+PASTA = "derivados"
+TIMEOUT = 60 * 60 * 24 * 30
+TIMEOUT_PENDENTE = 60  # estado ainda não final: consulta o banco de novo logo
+PLACEHOLDER = "img/defaults/processando.svg"
+MAX_TENTATIVAS = 5
+_BLOCO = 64 * 1024
+
+
+def tamanhos():
+    return settings.IMAGENS_TAMANHOS
+
+
+def _formato():
+    formato = settings.IMAGENS_FORMATO.upper()
+    if formato == "WEBP" and not features.check("webp"):
+        formato = "JPEG"  # Pillow compilado sem libwebp
+    return formato
+
+
+def _chave(nome):
+    return f"{PREFIXO}:{hashlib.md5(nome.encode()).hexdigest()}"
+
+
+def sha256_arquivo(f):
+    h = hashlib.sha256()
+    f.seek(0)
+    for bloco in iter(lambda: f.read(_BLOCO), b""):
+        h.update(bloco)
+    f.seek(0)
+    return h.hexdigest()
+
+
+def nome_derivado(sha, tamanho):
+    lado = tamanhos()[tamanho]
+    ext = "webp" if _formato() == "WEBP" else "jpg"
+    return f"{PASTA}/{sha[:2]}/{sha}_{lado}.{ext}"
+
+
+def _reduzir(f, lado):
+    """Abre, corrige a orientação (EXIF), reduz ao lado maior e recomprime."""
+    formato = _formato()
+    with Image.open(f) as img:
+        # JPEG: decodifica já reduzido (1/2, 1/4, 1/8) quando dá
+        img.draft("RGB", (lado, lado))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((lado, lado), Image.Resampling.LANCZOS)
+        if formato == "JPEG" or img.mode not in ("RGB", "RGBA"):
+            tem_alfa = img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info
+            img = img.convert("RGBA" if tem_alfa and formato == "WEBP" else "RGB")
+        opcoes = {"method": 4} if formato == "WEBP" else {"optimize": True, "progressive": True}
+        buf = BytesIO()
+        img.save(buf, formato, quality=settings.IMAGENS_QUALIDADE, **opcoes)
+    return buf.getvalue()
+
+
+def _salvar(storage, destino, conteudo):
+    salvo = storage.save(destino, ContentFile(conteudo))
+    if salvo != destino:
+        # outro processo gerou o mesmo arquivo ao mesmo tempo
+        storage.delete(salvo)
+
+
+def gerar(nome, tamanhos_pedidos=None, storage=None):
+    """
+    Gera os derivados que ainda não existirem de ``nome`` (todos os tamanhos,
+    ou só os pedidos) e devolve o SHA-256 do original. No storage por
+    conteúdo o hash já está no nome e o original só é lido se faltar algum.
+    """
+    storage = storage or default_storage
+    sha = sha256_do_nome(nome)
+    if sha is None:
+        with storage.open(nome, "rb") as f:
+            sha = sha256_arquivo(f)
+    faltando = [t for t in tamanhos_pedidos or tamanhos() if not storage.exists(nome_derivado(sha, t))]
+    if faltando:
+        with storage.open(nome, "rb") as f:
+            for tamanho in faltando:
+                f.seek(0)
+                _salvar(storage, nome_derivado(sha, tamanho), _reduzir(f, tamanhos()[tamanho]))
+    return sha
+
+
+def _validar(storage, nome):
+    """Lê só o cabeçalho e confere a estrutura (verify) sem decodificar os pixels."""
+    with storage.open(nome, "rb") as f, Image.open(f) as img:
+        img.verify()
+        return img.format, img.size
+
+
+_EXTENSOES = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp"}
+
+
+def _reduzir_original_bytes(f, lado, formato):
+    """
+    Reduz um original ao lado maior ``lado`` mantendo o formato (outros viram
+    JPEG). Para JPEG, ``draft`` decodifica já em escala reduzida: a memória
+    usada acompanha o tamanho final, não os megapixels da foto.
+    Retorna (bytes, formato).
+    """
+    formato = formato if formato in _EXTENSOES else "JPEG"
+    with Image.open(f) as img:
+        img.draft("RGB", (lado, lado))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((lado, lado), Image.Resampling.LANCZOS)
+        if formato == "JPEG" and img.mode != "RGB":
+            img = img.convert("RGB")
+        buf = BytesIO()
+        img.save(buf, formato, quality=90)
+    return buf.getvalue(), formato
+
+
+def _trocar_extensao(nome, formato):
+    return f"{os.path.splitext(os.path.basename(nome))[0]}.{_EXTENSOES[formato]}"
+
+
+def reduzir_upload(arquivo, lado):
+    """
+    Reduz um upload (já validado pelo form) que passe de ``lado`` px; se não
+    passar, devolve o próprio arquivo. Usado pelos forms de Pet e Produto
+    para que o original gigante nem chegue ao storage.
+    """
+    caminho = arquivo.temporary_file_path() if hasattr(arquivo, "temporary_file_path") else arquivo
+    arquivo.seek(0)
+    with Image.open(caminho) as img:
+        formato, (largura, altura) = img.format, img.size
+    arquivo.seek(0)
+    if max(largura, altura) <= lado:
+        return arquivo
+    conteudo, formato = _reduzir_original_bytes(caminho, lado, formato)
+    return ContentFile(conteudo, name=_trocar_extensao(arquivo.name, formato))
+
+
+def _reduzir_original(model, campo, nome, formato):
+    """
+    Regrava o original reduzido a IMAGENS_LADO_MAXIMO e aponta para ele todas
+    as linhas que usavam o arquivo antigo, em qualquer campo de
+    CAMPOS_DE_ARQUIVO — o storage por conteúdo deduplica entre modelos
+    (UPDATE direto: não dispara os signals, então ajusta as referências e
+    invalida os caches aqui). O arquivo antigo fica para o
+    ``manage.py limpar_midia``. Retorna o nome novo.
+    """
+    field = model._meta.get_field(campo)
+    storage = field.storage
+    with storage.open(nome, "rb") as f:
+        conteudo, formato = _reduzir_original_bytes(f, settings.IMAGENS_LADO_MAXIMO, formato)
+    novo = storage.save(field.generate_filename(None, _trocar_extensao(nome, formato)), ContentFile(conteudo))
+
+    total, secoes, user_ids = 0, set(), set()
+    for rotulo, nome_campo in CAMPOS_DE_ARQUIVO:
+        outro = apps.get_model(rotulo)
+        linhas = outro.objects.filter(**{nome_campo: nome})
+        if hasattr(outro, "user_id"):
+            user_ids.update(linhas.values_list("user_id", flat=True))
+        n = linhas.update(**{nome_campo: novo})
+        if n:
+            total += n
+            secoes.update(cache_home.SECOES_POR_MODELO.get(outro.__name__, ()))
+    if not total:
+        return None  # ninguém mais usa o arquivo: tarefa obsoleta
+    ArquivoMidia.objects.ajustar({novo: total, nome: -total})
+    cache_home.invalidar(*secoes)
+    if user_ids:
+        cartoes.invalidar(*user_ids)
+    return novo
+
+
+def processar(tarefa):
+    """
+    Executa uma tarefa da fila: valida, reduz o original se passar do lado
+    máximo e gera os derivados. Arquivo ausente/inválido marca "falhou";
+    outros erros voltam para a fila com espera crescente.
+    """
+    Tarefa = type(tarefa)
+    model = apps.get_model(tarefa.modelo)
+    storage = model._meta.get_field(tarefa.campo).storage
+    nome_original = tarefa.nome
+    try:
+        formato, (largura, altura) = _validar(storage, tarefa.nome)
+    except (OSError, SyntaxError, Image.DecompressionBombError) as e:
+        # OSError inclui arquivo ausente e UnidentifiedImageError; o verify()
+        # do Pillow levanta SyntaxError para arquivo corrompido
+        tarefa.status, tarefa.erro = Tarefa.FALHOU, f"{type(e).__name__}: {e}"
+    else:
+        try:
+            if max(largura, altura) > settings.IMAGENS_LADO_MAXIMO:
+                novo = _reduzir_original(model, tarefa.campo, tarefa.nome, formato)
+                if novo is None:
+                    tarefa.delete()
+                    return
+                tarefa.nome = novo
+            tarefa.sha256 = gerar(tarefa.nome, storage=storage)
+            tarefa.status, tarefa.erro = Tarefa.CONCLUIDA, ""
+        except Exception as e:
+            logger.exception("Falha processando %s", tarefa.nome)
+            tarefa.erro = f"{type(e).__name__}: {e}"
+            if tarefa.tentativas >= MAX_TENTATIVAS:
+                tarefa.status = Tarefa.FALHOU
+            else:
+                tarefa.status = Tarefa.PENDENTE
+                tarefa.disponivel_em = timezone.now() + timedelta(minutes=2 ** tarefa.tentativas)
+    tarefa.save()
+    cache.delete_many([_chave(nome_original), _chave(tarefa.nome)])
+    if tarefa.status != Tarefa.PENDENTE:
+        # os blocos da home guardam a URL resolvida (placeholder até aqui)
+        cache_home.invalidar(*cache_home.SECOES_POR_MODELO.get(model.__name__, ()))
+
+
+def _estados(nomes):
+    """
+    {nome: (status, sha256)} de vários originais, ou (None, "") para os que
+    nunca foram registrados: um get_many no cache e uma query só para o resto.
+    """
+    from .models import ProcessamentoImagem
+    chaves = {_chave(nome): nome for nome in nomes}
+    estados = {chaves[k]: v for k, v in cache.get_many(chaves).items()}
+    faltando = set(chaves.values()) - estados.keys()
+    if faltando:
+        linhas = (ProcessamentoImagem.objects.filter(nome__in=faltando)
+                  .values_list("nome", "status", "sha256"))
+        for nome, status, sha in linhas:
+            # o mesmo arquivo pode ter uma tarefa por modelo: a concluída vale
+            if estados.get(nome, (None,))[0] != ProcessamentoImagem.CONCLUIDA:
+                estados[nome] = (status, sha)
+        finais, pendentes = {}, {}
+        for nome in faltando:
+            estado = estados.setdefault(nome, (None, ""))
+            final = estado[0] in (ProcessamentoImagem.CONCLUIDA, ProcessamentoImagem.FALHOU)
+            (finais if final else pendentes)[_chave(nome)] = estado
+        cache.set_many(finais, TIMEOUT)
+        cache.set_many(pendentes, TIMEOUT_PENDENTE)
+    return estados
+
+
+def _estado(nome):
+    """(status, sha256) do original, ou (None, "") se ele nunca foi registrado."""
+    return _estados([nome])[nome]
+
+
+def com_miniaturas(objetos, campo, tamanho="card"):
+    """
+    Resolve de uma vez a URL do derivado de cada objeto em
+    ``<campo>_<tamanho>`` (ex.: ``pet.imagem_card``), com uma consulta de
+    estado para a lista toda. Usado nas listagens e nos blocos do cache_home
+    (a URL vai junto com o bloco).
+    """
+    objetos = list(objetos)
+    estados = _estados({getattr(obj, campo).name for obj in objetos if getattr(obj, campo)})
+    for obj in objetos:
+        arquivo = getattr(obj, campo)
+        url = url_derivado(arquivo, tamanho, estados.get(arquivo.name)) if arquivo else ""
+        setattr(obj, f"{campo}_{tamanho}", url)
+    return objetos
+
+
+def url_derivado(campo, tamanho, estado=None):
+    """
+    URL do derivado de um ImageField/FieldFile. Vazio -> "". Ainda na fila ->
+    placeholder; inválido ou nunca registrado -> URL do original. ``estado``
+    já resolvido (ver ``_estados``) evita a consulta.
+    """
+    if not campo:
+        return ""
+    status, sha = estado or _estado(campo.name)
+    if status == "concluida":
+        return campo.storage.url(nome_derivado(sha, tamanho))
+    if status in ("pendente", "processando"):
+        return static(PLACEHOLDER)
+    return campo.url
@@ -0,0 +1,56 @@
+# AmigoFiel/management/commands/gerar_miniaturas.py
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from AmigoFiel import imagens
+from AmigoFiel.models import CAMPOS_DE_ARQUIVO, ProcessamentoImagem
+
+
+class Command(BaseCommand):
+    help = (
+        "Backfill dos derivados de imagem: registra na fila os arquivos que "
+        "ainda não passaram por ela e gera os tamanhos que faltarem para os já "
+        "processados (ex.: depois de adicionar um tamanho em IMAGENS_TAMANHOS). "
+        "Pode rodar de novo; o resto fica com manage.py processar_imagens."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--tamanhos", nargs="+", metavar="NOME",
+            help="Só estes tamanhos (padrão: todos de IMAGENS_TAMANHOS).",
+        )
+
+    def handle(self, *args, **options):
+        tamanhos = options["tamanhos"] or list(imagens.tamanhos())
+        desconhecidos = set(tamanhos) - set(imagens.tamanhos())
+        if desconhecidos:
+            raise CommandError(f"Tamanho(s) desconhecido(s): {', '.join(sorted(desconhecidos))}")
+
+        enfileirados = 0
+        for rotulo, campo in CAMPOS_DE_ARQUIVO:
+            model = apps.get_model(rotulo)
+            linhas = (model.objects.exclude(**{campo: ""}).exclude(**{f"{campo}__isnull": True})
+                      .values_list("pk", campo))
+            novos = [
+                ProcessamentoImagem(nome=nome, modelo=model._meta.label, objeto_id=pk, campo=campo)
+                for pk, nome in linhas.iterator()
+            ]
+            enfileirados += len(ProcessamentoImagem.objects.bulk_create(
+                novos, ignore_conflicts=True, batch_size=500,
+            ))
+
+        gerados = falhas = 0
+        concluidos = ProcessamentoImagem.objects.filter(status=ProcessamentoImagem.CONCLUIDA)
+        for tarefa in concluidos.iterator():
+            storage = apps.get_model(tarefa.modelo)._meta.get_field(tarefa.campo).storage
+            try:
+                imagens.gerar(tarefa.nome, tamanhos, storage)
+                gerados += 1
+            except OSError as e:
+                falhas += 1
+                self.stderr.write(f"{tarefa.nome}: {e}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Arquivos verificados: {gerados} (falhas: {falhas}); "
+            f"até {enfileirados} registrado(s) na fila — rode processar_imagens."
+        ))
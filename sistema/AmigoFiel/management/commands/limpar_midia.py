@@ -0,0 +1,118 @@
+# AmigoFiel/management/commands/limpar_midia.py
+import os
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from AmigoFiel.imagens import PASTA as PASTA_DERIVADOS
+from AmigoFiel.models import ArquivoMidia, ProcessamentoImagem
+from AmigoFiel.storage import PASTA as PASTA_ARQUIVOS
+
+
+class Command(BaseCommand):
+    help = (
+        "Apaga arquivos de mídia sem referência (ArquivoMidia com 0 referências, "
+        "ex.: a foto antiga depois de editar um pet/produto) e os derivados "
+        "deles. Com --varrer, também percorre as pastas de upload antigas e "
+        "apaga o que nenhuma linha usa."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--horas", type=int, default=24,
+                            help="Só apaga o que está sem referência há mais que isso (padrão: 24).")
+        parser.add_argument("--recontar", action="store_true",
+                            help="Refaz as referências a partir do banco antes de limpar.")
+        parser.add_argument("--varrer", action="store_true",
+                            help="Também varre pets/, produtos/, usuarios/ e derivados/.")
+        parser.add_argument("--dry-run", action="store_true", help="Só mostra o que seria apagado.")
+
+    def handle(self, *args, **options):
+        self.dry_run = options["dry_run"]
+        self.verbosity = options["verbosity"]
+        limite = timezone.now() - timedelta(hours=options["horas"])
+        if options["recontar"]:
+            n = ArquivoMidia.objects.recontar()
+            self.stdout.write(f"Referências corrigidas: {n}.")
+
+        apagados = self._limpar_sem_referencia(limite)
+        if options["varrer"]:
+            apagados += self._varrer(limite)
+
+        verbo = "Seriam apagados" if self.dry_run else "Apagados"
+        self.stdout.write(self.style.SUCCESS(f"{verbo}: {apagados} arquivo(s)."))
+
+    def _apagar(self, nome):
+        if self.verbosity > 1 or self.dry_run:
+            self.stdout.write(nome)
+        if not self.dry_run:
+            default_storage.delete(nome)
+
+    def _derivados_de(self, sha):
+        pasta = f"{PASTA_DERIVADOS}/{sha[:2]}"
+        try:
+            _, arquivos = default_storage.listdir(pasta)
+        except FileNotFoundError:
+            return []
+        return [f"{pasta}/{a}" for a in arquivos if a.startswith(f"{sha}_")]
+
+    def _limpar_sem_referencia(self, limite):
+        candidatos = list(ArquivoMidia.objects.filter(referencias__lte=0, atualizado_em__lt=limite))
+        # conferência definitiva no banco: contador com deriva não apaga nada em uso
+        em_uso = ArquivoMidia.objects.contar_referencias([a.nome for a in candidatos])
+        apagados = 0
+        for arquivo in candidatos:
+            if em_uso.get(arquivo.nome):
+                if not self.dry_run:
+                    ArquivoMidia.objects.filter(pk=arquivo.pk).update(referencias=em_uso[arquivo.nome])
+                continue
+            if self.dry_run:
+                apagados += self._apagar_arquivo(arquivo)
+                continue
+            with transaction.atomic():
+                # trava e confere de novo: um upload repetido nesse meio tempo
+                # renovou atualizado_em (ArquivoMidia.objects.registrar)
+                travado = (ArquivoMidia.objects.select_for_update()
+                           .filter(pk=arquivo.pk, referencias__lte=0, atualizado_em__lt=limite).first())
+                if travado is None:
+                    continue
+                travado.delete()
+                ProcessamentoImagem.objects.filter(nome=arquivo.nome).delete()
+                apagados += self._apagar_arquivo(arquivo)
+        return apagados
+
+    def _apagar_arquivo(self, arquivo):
+        nomes = [arquivo.nome, *self._derivados_de(arquivo.sha256)]
+        for nome in nomes:
+            self._apagar(nome)
+        return len(nomes)
+
+    def _listar(self, pasta):
+        try:
+            dirs, arquivos = default_storage.listdir(pasta)
+        except FileNotFoundError:
+            return
+        for a in arquivos:
+            yield f"{pasta}/{a}"
+        for d in dirs:
+            yield from self._listar(f"{pasta}/{d}")
+
+    def _varrer(self, limite):
+        em_uso = set(ArquivoMidia.objects.contar_referencias())
+        shas_em_uso = set(
+            ProcessamentoImagem.objects.filter(nome__in=em_uso).values_list("sha256", flat=True)
+        ) | {os.path.splitext(os.path.basename(n))[0] for n in em_uso if n.startswith(PASTA_ARQUIVOS)}
+
+        apagados = 0
+        for raiz in ("pets", "produtos", "usuarios", PASTA_ARQUIVOS, PASTA_DERIVADOS):
+            for nome in self._listar(raiz):
+                if raiz == PASTA_DERIVADOS:
+                    orfao = os.path.basename(nome).split("_", 1)[0] not in shas_em_uso
+                else:
+                    orfao = nome not in em_uso
+                if orfao and default_storage.get_modified_time(nome) < limite:
+                    self._apagar(nome)
+                    apagados += 1
+        return apagados
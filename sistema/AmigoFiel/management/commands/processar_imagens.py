@@ -0,0 +1,44 @@
+# AmigoFiel/management/commands/processar_imagens.py
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from AmigoFiel import imagens
+from AmigoFiel.models import ProcessamentoImagem
+
+
+class Command(BaseCommand):
+    help = (
+        "Worker da fila de imagens (ProcessamentoImagem): valida os uploads, "
+        "reduz originais grandes e gera os derivados. Rode um ou mais em "
+        "paralelo; cada um pega tarefas com FOR UPDATE SKIP LOCKED."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lote", type=int, default=10, help="Tarefas por rodada (padrão: 10).")
+        parser.add_argument("--intervalo", type=float, default=2.0,
+                            help="Segundos de espera com a fila vazia (padrão: 2).")
+        parser.add_argument("--uma-vez", action="store_true",
+                            help="Esvazia a fila e sai, em vez de ficar esperando tarefas.")
+
+    def handle(self, *args, **options):
+        travada_ha = timedelta(minutes=10)
+        feitas = 0
+        try:
+            while True:
+                close_old_connections()
+                tarefas = ProcessamentoImagem.objects.pegar_lote(options["lote"], travada_ha)
+                for tarefa in tarefas:
+                    imagens.processar(tarefa)
+                    feitas += 1
+                    if options["verbosity"] > 1:
+                        self.stdout.write(f"{tarefa.nome}: {tarefa.status}")
+                if not tarefas:
+                    if options["uma_vez"]:
+                        break
+                    time.sleep(options["intervalo"])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f"Tarefas processadas: {feitas}."))
@@ -0,0 +1,21 @@
+# AmigoFiel/management/commands/recalcular_contadores.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from AmigoFiel.models import UsuarioEmpresarial, UsuarioOng
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula os contadores desnormalizados de ONGs (pets) e empresas "
+        "(produtos ativos / com vínculo a ONG). Use após cargas em massa ou "
+        "alterações feitas direto no banco."
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            n_ongs = UsuarioOng.objects.all().recalcular_contadores()
+            n_empresas = UsuarioEmpresarial.objects.all().recalcular_contadores()
+        self.stdout.write(self.style.SUCCESS(
+            f"Contadores recalculados: {n_ongs} ONG(s), {n_empresas} empresa(s)."
+        ))
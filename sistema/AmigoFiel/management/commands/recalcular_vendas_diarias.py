@@ -0,0 +1,19 @@
+# AmigoFiel/management/commands/recalcular_vendas_diarias.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from AmigoFiel.models import VendaDiaria
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstrói o rollup diário de vendas/doações (VendaDiaria) a partir "
+        "de ItemPedido. Use após cargas em massa ou correções feitas direto no banco."
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            n = VendaDiaria.objects.reconstruir()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rollup de vendas reconstruído: {n} linha(s)."
+        ))
@@ -0,0 +1,151 @@
+# AmigoFiel/midia.py
+"""
+Entrega de /media/ (substitui o ``static()`` do Django, que só lia o
+arquivo pelo Python e sem cabeçalhos de cache).
+
+- ETag forte e Last-Modified, com 304 via ``get_conditional_response``;
+- nomes com hash (``arquivos/`` do storage por conteúdo e ``derivados/``)
+  nunca mudam de conteúdo: ``Cache-Control: immutable`` por um ano;
+- ``Range: bytes=...`` (uma faixa) com 206/416 e ``If-Range``;
+- ``MEDIA_SENDFILE = "x-accel"`` (nginx) ou ``"x-sendfile"`` (Apache):
+  o Django só decide cabeçalhos e o servidor web envia os bytes.
+"""
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+from .imagens import PASTA as PASTA_DERIVADOS
+from .storage import sha256_do_nome
+
+UM_ANO = 60 * 60 * 24 * 365
+_BLOCO = 64 * 1024
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _etag(caminho, st):
+    sha = sha256_do_nome(caminho)
+    if sha:
+        return f'"{sha}"'
+    if caminho.startswith(f"{PASTA_DERIVADOS}/"):
+        return f'"{os.path.splitext(os.path.basename(caminho))[0]}"'
+    return f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+
+def _imutavel(caminho):
+    return bool(sha256_do_nome(caminho)) or caminho.startswith(f"{PASTA_DERIVADOS}/")
+
+
+def _faixa(cabecalho, tamanho):
+    """
+    (inicio, fim) inclusivo de um ``Range`` com uma faixa só; None para
+    ignorar o cabeçalho (envia tudo); "invalida" para 416.
+    """
+    m = _RANGE.match(cabecalho.strip())
+    if not m:
+        return None  # sintaxe desconhecida ou várias faixas: resposta inteira
+    inicio, fim = m.groups()
+    if not inicio and not fim:
+        return None
+    if tamanho == 0:
+        return "invalida"  # nenhuma faixa cabe num arquivo vazio
+    if not inicio:  # sufixo: os últimos N bytes
+        n = int(fim)
+        if n == 0:
+            return "invalida"
+        return max(tamanho - n, 0), tamanho - 1
+    inicio = int(inicio)
+    fim = min(int(fim), tamanho - 1) if fim else tamanho - 1
+    if inicio >= tamanho or fim < inicio:
+        return "invalida"
+    return inicio, fim
+
+
+def _ler(caminho_abs, inicio, fim):
+    with open(caminho_abs, "rb") as f:
+        f.seek(inicio)
+        restante = fim - inicio + 1
+        while restante > 0:
+            bloco = f.read(min(_BLOCO, restante))
+            if not bloco:
+                break
+            restante -= len(bloco)
+            yield bloco
+
+
+@require_safe
+def servir_midia(request, caminho):
+    try:
+        caminho_abs = safe_join(settings.MEDIA_ROOT, caminho)
+        st = os.stat(caminho_abs)
+    except (SuspiciousFileOperation, OSError):  # Suspicious...: caminho saindo do MEDIA_ROOT
+        raise Http404("Arquivo não encontrado.")
+    if not os.path.isfile(caminho_abs):
+        raise Http404("Arquivo não encontrado.")
+
+    etag = _etag(caminho, st)
+    cabecalhos = {
+        "ETag": etag,
+        "Last-Modified": http_date(st.st_mtime),
+        "Cache-Control": (
+            f"public, max-age={UM_ANO}, immutable" if _imutavel(caminho)
+            else f"public, max-age={settings.MEDIA_CACHE_SEGUNDOS}"
+        ),
+        "Accept-Ranges": "bytes",
+    }
+
+    def _com_cabecalhos(resp):
+        for k, v in cabecalhos.items():
+            resp[k] = v
+        return resp
+
+    condicional = get_conditional_response(request, etag=etag, last_modified=int(st.st_mtime))
+    if condicional is not None:  # 304 (ou 412)
+        return _com_cabecalhos(condicional)
+
+    content_type, encoding = mimetypes.guess_type(caminho_abs)
+    content_type = content_type or "application/octet-stream"
+
+    sendfile = settings.MEDIA_SENDFILE
+    if sendfile in ("x-accel", "x-sendfile"):
+        # o servidor web envia o arquivo (e trata Range sozinho)
+        resp = HttpResponse(content_type=content_type)
+        if sendfile == "x-accel":
+            resp["X-Accel-Redirect"] = settings.MEDIA_ACCEL_PREFIX.rstrip("/") + "/" + caminho
+        else:
+            resp["X-Sendfile"] = caminho_abs
+        return _com_cabecalhos(resp)
+
+    faixa = None
+    if "HTTP_RANGE" in request.META:
+        if_range = request.META.get("HTTP_IF_RANGE")
+        if not if_range or if_range == etag:
+            faixa = _faixa(request.META["HTTP_RANGE"], st.st_size)
+    if faixa == "invalida":
+        resp = HttpResponse(status=416)
+        resp["Content-Range"] = f"bytes */{st.st_size}"
+        return _com_cabecalhos(resp)
+
+    if request.method == "HEAD":
+        resp = HttpResponse(content_type=content_type)
+        resp["Content-Length"] = st.st_size
+        return _com_cabecalhos(resp)
+
+    if faixa:
+        inicio, fim = faixa
+        resp = StreamingHttpResponse(_ler(caminho_abs, inicio, fim), status=206, content_type=content_type)
+        resp["Content-Range"] = f"bytes {inicio}-{fim}/{st.st_size}"
+        resp["Content-Length"] = fim - inicio + 1
+    else:
+        # FileResponse usa o wsgi.file_wrapper do servidor (sendfile no gunicorn)
+        resp = FileResponse(open(caminho_abs, "rb"), content_type=content_type)
+    if encoding:
+        resp["Content-Encoding"] = encoding
+    return _com_cabecalhos(resp)
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:27
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import UnaccentExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+
+# portuguese + unaccent: "cão" e "cao" geram o mesmo lexema
+CRIAR_CONFIG_BUSCA = """
+CREATE TEXT SEARCH CONFIGURATION portuguese_unaccent (COPY = portuguese);
+ALTER TEXT SEARCH CONFIGURATION portuguese_unaccent
+    ALTER MAPPING FOR hword, hword_part, word WITH unaccent, portuguese_stem;
+"""
+
+REMOVER_CONFIG_BUSCA = "DROP TEXT SEARCH CONFIGURATION IF EXISTS portuguese_unaccent;"
+
+
+def backfill_pet_search_vector(apps, schema_editor):
+    Pet = apps.get_model('AmigoFiel', 'Pet')
+    Pet.objects.update(
+        search_vector=(
+            SearchVector('nome', weight='A', config='portuguese_unaccent')
+            + SearchVector('raca', weight='B', config='portuguese_unaccent')
+            + SearchVector('descricao', weight='C', config='portuguese_unaccent')
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('AmigoFiel', '0022_usuariocomum_estado_usuarioempresarial_estado_and_more'),
+    ]
+
+    operations = [
+        UnaccentExtension(),
+        migrations.RunSQL(CRIAR_CONFIG_BUSCA, REMOVER_CONFIG_BUSCA),
+        migrations.AddField(
+            model_name='pet',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='pet',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='pet_search_vector_gin'),
+        ),
+        migrations.RunPython(backfill_pet_search_vector, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:28
+
+import unicodedata
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models
+
+
+def backfill_produto_busca(apps, schema_editor):
+    from AmigoFiel.consts import PRODUTO_CATEGORIAS_CHOICES
+
+    ProdutoEmpresa = apps.get_model('AmigoFiel', 'ProdutoEmpresa')
+    categorias = dict(PRODUTO_CATEGORIAS_CHOICES)
+
+    def normalizar(texto):
+        decomposto = unicodedata.normalize('NFKD', texto or '')
+        return ''.join(c for c in decomposto if not unicodedata.combining(c)).lower()
+
+    lote = []
+    for produto in ProdutoEmpresa.objects.select_related('empresa', 'empresa__user').iterator():
+        partes = [
+            produto.nome,
+            produto.descricao_curta,
+            categorias.get(produto.categoria, produto.categoria),
+            produto.empresa.razao_social,
+            produto.empresa.user.username,
+        ]
+        produto.search_document = normalizar(' '.join(p for p in partes if p))
+        lote.append(produto)
+        if len(lote) >= 500:
+            ProdutoEmpresa.objects.bulk_update(lote, ['search_document'])
+            lote = []
+    if lote:
+        ProdutoEmpresa.objects.bulk_update(lote, ['search_document'])
+
+    ProdutoEmpresa.objects.update(
+        search_vector=(
+            SearchVector('nome', weight='A', config='portuguese_unaccent')
+            + SearchVector('descricao_curta', weight='B', config='portuguese_unaccent')
+            + SearchVector('search_document', weight='C', config='portuguese_unaccent')
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('AmigoFiel', '0023_pet_search_vector'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='produtoempresa',
+            name='search_document',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='produtoempresa',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='produtoempresa',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='produto_search_vector_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='produtoempresa',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_document'], name='produto_search_doc_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.RunPython(backfill_produto_busca, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('AmigoFiel', '0024_produto_search_document'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pet',
+            index=models.Index(condition=models.Q(('adotado', False)), fields=['-criado_em'], name='pet_disp_recente_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pet',
+            index=models.Index(condition=models.Q(('adotado', False)), fields=['especie', '-criado_em'], name='pet_disp_especie_recente_idx'),
+        ),
+    ]
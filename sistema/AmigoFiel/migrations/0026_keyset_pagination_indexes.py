@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('AmigoFiel', '0025_pet_disponiveis_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='produtoempresa',
+            index=models.Index(condition=models.Q(('ativo', True)), fields=['nome', 'id'], name='produto_ativo_nome_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usuarioong',
+            index=models.Index(fields=['nome_fantasia', 'id'], name='ong_nome_id_idx'),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:31
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def _contagem(qs, campo_pai):
+    return Coalesce(
+        Subquery(qs.order_by().values(campo_pai).annotate(c=Count('pk', distinct=True)).values('c')[:1]),
+        0,
+    )
+
+
+def backfill_contadores(apps, schema_editor):
+    Pet = apps.get_model('AmigoFiel', 'Pet')
+    ProdutoEmpresa = apps.get_model('AmigoFiel', 'ProdutoEmpresa')
+    UsuarioOng = apps.get_model('AmigoFiel', 'UsuarioOng')
+    UsuarioEmpresarial = apps.get_model('AmigoFiel', 'UsuarioEmpresarial')
+
+    pets = Pet.objects.filter(ong=OuterRef('pk'))
+    UsuarioOng.objects.update(
+        qtd_pets=_contagem(pets, 'ong'),
+        qtd_pets_disponiveis=_contagem(pets.filter(adotado=False), 'ong'),
+    )
+    produtos = ProdutoEmpresa.objects.filter(empresa=OuterRef('pk'))
+    UsuarioEmpresarial.objects.update(
+        qtd_produtos=_contagem(produtos, 'empresa'),
+        qtd_produtos_ativos=_contagem(produtos.filter(ativo=True), 'empresa'),
+        qtd_produtos_com_ong=_contagem(produtos.filter(vinculos_ong__ativo=True), 'empresa'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('AmigoFiel', '0026_keyset_pagination_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usuarioempresarial',
+            name='qtd_produtos',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='usuarioempresarial',
+            name='qtd_produtos_ativos',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='usuarioempresarial',
+            name='qtd_produtos_com_ong',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='usuarioong',
+            name='qtd_pets',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='usuarioong',
+            name='qtd_pets_disponiveis',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='usuarioempresarial',
+            index=models.Index(fields=['-qtd_produtos_ativos', 'razao_social', 'id'], name='empresa_ranking_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usuarioong',
+            index=models.Index(fields=['-qtd_pets', 'nome_fantasia'], name='ong_ranking_idx'),
+        ),
+        migrations.RunPython(backfill_contadores, migrations.RunPython.noop),
+    ]
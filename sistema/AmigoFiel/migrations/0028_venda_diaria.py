@@ -0,0 +1,60 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:35
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_vendas_diarias(apps, schema_editor):
+    ItemPedido = apps.get_model('AmigoFiel', 'ItemPedido')
+    VendaDiaria = apps.get_model('AmigoFiel', 'VendaDiaria')
+    agregado = (
+        ItemPedido.objects
+        .annotate(dia=TruncDate('criado_em'))
+        .values('empresa_id', 'ong_id', 'produto_id', 'dia')
+        .annotate(qtd=Sum('quantidade'), n=Count('id'), receita=Sum('total'), doacao=Sum('valor_doacao'))
+        .order_by()
+    )
+    lote = []
+    for a in agregado.iterator():
+        lote.append(VendaDiaria(
+            empresa_id=a['empresa_id'], ong_id=a['ong_id'], produto_id=a['produto_id'], dia=a['dia'],
+            quantidade=a['qtd'], itens=a['n'],
+            receita=a['receita'] or Decimal('0.00'), doacao=a['doacao'] or Decimal('0.00'),
+        ))
+        if len(lote) >= 1000:
+            VendaDiaria.objects.bulk_create(lote)
+            lote = []
+    if lote:
+        VendaDiaria.objects.bulk_create(lote)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('AmigoFiel', '0027_contadores_desnormalizados'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VendaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('quantidade', models.PositiveIntegerField(default=0)),
+                ('itens', models.PositiveIntegerField(default=0)),
+                ('receita', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('doacao', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vendas_diarias', to='AmigoFiel.usuarioempresarial')),
+                ('ong', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='vendas_diarias', to='AmigoFiel.usuarioong')),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vendas_diarias', to='AmigoFiel.produtoempresa')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['empresa', 'dia'], name='venda_diaria_empresa_dia_idx'), models.Index(fields=['ong', 'dia'], name='venda_diaria_ong_dia_idx'), models.Index(fields=['produto', 'dia'], name='venda_diaria_produto_dia_idx')],
+                'constraints': [models.UniqueConstraint(fields=('empresa', 'ong', 'produto', 'dia'), name='venda_diaria_chave_unica')],
+            },
+        ),
+        migrations.RunPython(backfill_vendas_diarias, migrations.RunPython.noop),
+    ]
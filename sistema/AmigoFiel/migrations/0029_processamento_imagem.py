@@ -0,0 +1,60 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:50
+
+import django.utils.timezone
+from django.db import migrations, models
+
+CAMPOS = (
+    ('Pet', 'imagem'),
+    ('ProdutoEmpresa', 'imagem'),
+    ('UsuarioComum', 'foto'),
+    ('UsuarioEmpresarial', 'foto'),
+    ('UsuarioEmpresarial', 'banner'),
+    ('UsuarioOng', 'foto'),
+    ('UsuarioOng', 'banner'),
+)
+
+
+def enfileirar_existentes(apps, schema_editor):
+    ProcessamentoImagem = apps.get_model('AmigoFiel', 'ProcessamentoImagem')
+    for nome_modelo, campo in CAMPOS:
+        Model = apps.get_model('AmigoFiel', nome_modelo)
+        linhas = Model.objects.exclude(**{campo: ''}).exclude(**{f'{campo}__isnull': True}).values_list('pk', campo)
+        ProcessamentoImagem.objects.bulk_create(
+            [
+                ProcessamentoImagem(nome=nome, modelo=f'AmigoFiel.{nome_modelo}', objeto_id=pk, campo=campo)
+                for pk, nome in linhas.iterator()
+            ],
+            ignore_conflicts=True,
+            batch_size=500,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('AmigoFiel', '0028_venda_diaria'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessamentoImagem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=255, unique=True)),
+                ('modelo', models.CharField(max_length=100)),
+                ('objeto_id', models.PositiveBigIntegerField()),
+                ('campo', models.CharField(max_length=50)),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('processando', 'Processando'), ('concluida', 'Concluída'), ('falhou', 'Falhou')], default='pendente', max_length=12)),
+                ('tentativas', models.PositiveSmallIntegerField(default=0)),
+                ('erro', models.TextField(blank=True, default='')),
+                ('sha256', models.CharField(blank=True, default='', max_length=64)),
+                ('disponivel_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('status__in', ['pendente', 'processando'])), fields=['disponivel_em', 'id'], name='procimg_fila_idx')],
+            },
+        ),
+        migrations.RunPython(enfileirar_existentes, migrations.RunPython.noop),
+    ]
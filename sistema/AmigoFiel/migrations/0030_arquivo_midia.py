@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('AmigoFiel', '0029_processamento_imagem'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArquivoMidia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=100, unique=True)),
+                ('sha256', models.CharField(db_index=True, max_length=64)),
+                ('tamanho', models.PositiveBigIntegerField(default=0)),
+                ('referencias', models.IntegerField(default=0)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('referencias__lte', 0)), fields=['atualizado_em'], name='arquivo_midia_orfao_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:02
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def refazer_vendas_diarias(apps, schema_editor):
+    # com NULLs distintos, itens sem ONG podem ter gerado linhas repetidas:
+    # refaz o rollup a partir de ItemPedido antes de criar a constraint nova
+    ItemPedido = apps.get_model('AmigoFiel', 'ItemPedido')
+    VendaDiaria = apps.get_model('AmigoFiel', 'VendaDiaria')
+    VendaDiaria.objects.all().delete()
+    agregado = (
+        ItemPedido.objects
+        .annotate(dia=TruncDate('criado_em'))
+        .values('empresa_id', 'ong_id', 'produto_id', 'dia')
+        .annotate(qtd=Sum('quantidade'), n=Count('id'), receita=Sum('total'), doacao=Sum('valor_doacao'))
+        .order_by()
+    )
+    lote = []
+    for a in agregado.iterator():
+        lote.append(VendaDiaria(
+            empresa_id=a['empresa_id'], ong_id=a['ong_id'], produto_id=a['produto_id'], dia=a['dia'],
+            quantidade=a['qtd'], itens=a['n'],
+            receita=a['receita'] or Decimal('0.00'), doacao=a['doacao'] or Decimal('0.00'),
+        ))
+        if len(lote) >= 1000:
+            VendaDiaria.objects.bulk_create(lote)
+            lote = []
+    if lote:
+        VendaDiaria.objects.bulk_create(lote)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('AmigoFiel', '0030_arquivo_midia'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='vendadiaria',
+            name='venda_diaria_chave_unica',
+        ),
+        migrations.RunPython(refazer_vendas_diarias, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='vendadiaria',
+            constraint=models.UniqueConstraint(fields=('empresa', 'ong', 'produto', 'dia'), name='venda_diaria_chave_unica', nulls_distinct=False),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('AmigoFiel', '0031_venda_diaria_nulls_nao_distintos'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='vendadiaria',
+            name='ong',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='vendas_diarias', to='AmigoFiel.usuarioong'),
+        ),
+    ]
@@ -1,15 +1,34 @@
 # -*- coding: utf-8 -*-
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils.text import slugify
 from django.urls import reverse
+from django.utils import timezone
 from django.core.validators import MinValueValidator
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVector, SearchVectorField, TrigramWordSimilarity,
+)
 from .consts import PET_SPECIES_CHOICES, SEXO_CHOICES, PRODUTO_CATEGORIAS_CHOICES
 
 import uuid
+import unicodedata
+from itertools import islice
 
 from decimal import Decimal
-from django.db.models import Sum, F
+from django.db.models import Sum, F, Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce, TruncDate
+
+# Configuração de busca textual do Postgres: "portuguese" + unaccent
+# (criada na migration 0023_pet_search_vector)
+BUSCA_CONFIG = "portuguese_unaccent"
+
+
+def normalizar_busca(texto):
+    """Minúsculas e sem acentos (ex.: "Ração Cão" -> "racao cao")."""
+    decomposto = unicodedata.normalize("NFKD", texto or "")
+    return "".join(c for c in decomposto if not unicodedata.combining(c)).lower()
+
 
 # =============================================================================
 # Abstrações
@@ -26,6 +45,54 @@ class TimeStampedModel(models.Model):
 # =============================================================================
 # Perfis (1-para-1 com User)
 # =============================================================================
+def _contagem(qs, campo_pai):
+    """COUNT correlacionado (subquery) para usar em UPDATE ... SET col = (SELECT COUNT ...)."""
+    return Coalesce(
+        Subquery(
+            qs.order_by().values(campo_pai).annotate(c=Count("pk", distinct=True)).values("c")[:1]
+        ),
+        0,
+    )
+
+
+class ContadoresMixin:
+    """
+    Os contadores só são escritos por recalcular_contadores(); um save() comum
+    do perfil (ex.: perfil_editar) não pode sobrescrevê-los com valores lidos
+    antes de uma venda/cadastro concorrente.
+    """
+    CONTADORES = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.CONTADORES
+            ]
+        super().save(*args, **kwargs)
+
+
+class EmpresaQuerySet(models.QuerySet):
+    def recalcular_contadores(self):
+        """Recalcula os contadores desnormalizados em um único UPDATE."""
+        produtos = ProdutoEmpresa.objects.filter(empresa=OuterRef("pk"))
+        return self.update(
+            qtd_produtos=_contagem(produtos, "empresa"),
+            qtd_produtos_ativos=_contagem(produtos.filter(ativo=True), "empresa"),
+            qtd_produtos_com_ong=_contagem(produtos.filter(vinculos_ong__ativo=True), "empresa"),
+        )
+
+
+class OngQuerySet(models.QuerySet):
+    def recalcular_contadores(self):
+        """Recalcula os contadores desnormalizados em um único UPDATE."""
+        pets = Pet.objects.filter(ong=OuterRef("pk"))
+        return self.update(
+            qtd_pets=_contagem(pets, "ong"),
+            qtd_pets_disponiveis=_contagem(pets.filter(adotado=False), "ong"),
+        )
+
+
 class UsuarioComum(TimeStampedModel):
     user = models.OneToOneField(
         User, on_delete=models.CASCADE, related_name="perfil_comum"
@@ -49,7 +116,7 @@ class UsuarioComum(TimeStampedModel):
         return f"Comum: {self.user.username}"
 
 
-class UsuarioEmpresarial(TimeStampedModel):
+class UsuarioEmpresarial(ContadoresMixin, TimeStampedModel):
     user = models.OneToOneField(
         User, on_delete=models.CASCADE, related_name="perfil_empresa"
     )
@@ -66,9 +133,26 @@ class UsuarioEmpresarial(TimeStampedModel):
         default="defaults/avatar_empresa.png",
     )
 
+    # Contadores desnormalizados (mantidos por AmigoFiel/signals.py;
+    # `manage.py recalcular_contadores` reconstrói todos)
+    qtd_produtos = models.PositiveIntegerField(default=0, editable=False)
+    qtd_produtos_ativos = models.PositiveIntegerField(default=0, editable=False)
+    qtd_produtos_com_ong = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = EmpresaQuerySet.as_manager()
+
+    CONTADORES = ("qtd_produtos", "qtd_produtos_ativos", "qtd_produtos_com_ong")
+
     class Meta:
         ordering = ("razao_social",)
-        indexes = [models.Index(fields=["cidade"])]
+        indexes = [
+            models.Index(fields=["cidade"]),
+            # /lojas/ e home: lojas com mais produtos ativos primeiro
+            models.Index(
+                fields=["-qtd_produtos_ativos", "razao_social", "id"],
+                name="empresa_ranking_idx",
+            ),
+        ]
 
     banner = models.ImageField(upload_to="usuarios/empresa/banner/%Y/%m/", blank=True, null=True)
     slogan = models.CharField(max_length=160, blank=True)
@@ -76,8 +160,23 @@ class UsuarioEmpresarial(TimeStampedModel):
     def __str__(self):
         return f"Empresa: {self.razao_social}"
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # razão social faz parte do documento de busca dos produtos
+        update_fields = kwargs.get("update_fields")
+        alterou = getattr(self, "_razao_social_original", self.razao_social) != self.razao_social
+        if alterou and (update_fields is None or "razao_social" in update_fields):
+            self.produtos.all().reindexar_busca()
+        self._razao_social_original = self.razao_social
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._razao_social_original = instance.__dict__.get("razao_social")
+        return instance
+
 
-class UsuarioOng(TimeStampedModel):
+class UsuarioOng(ContadoresMixin, TimeStampedModel):
     user = models.OneToOneField(
         User, on_delete=models.CASCADE, related_name="perfil_ong"
     )
@@ -95,9 +194,23 @@ class UsuarioOng(TimeStampedModel):
         default="defaults/avatar_ong.png",
     )
 
+    # Contadores desnormalizados (mantidos por AmigoFiel/signals.py)
+    qtd_pets = models.PositiveIntegerField(default=0, editable=False)
+    qtd_pets_disponiveis = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = OngQuerySet.as_manager()
+
+    CONTADORES = ("qtd_pets", "qtd_pets_disponiveis")
+
     class Meta:
         ordering = ("nome_fantasia",)
-        indexes = [models.Index(fields=["cidade"])]
+        indexes = [
+            models.Index(fields=["cidade"]),
+            # home: ONGs com mais pets primeiro
+            models.Index(fields=["-qtd_pets", "nome_fantasia"], name="ong_ranking_idx"),
+            # paginação keyset de /ongs/
+            models.Index(fields=["nome_fantasia", "id"], name="ong_nome_id_idx"),
+        ]
 
     banner = models.ImageField(upload_to="usuarios/ong/banner/%Y/%m/", blank=True, null=True)
     slogan = models.CharField(max_length=160, blank=True)
@@ -109,6 +222,27 @@ class UsuarioOng(TimeStampedModel):
 # =============================================================================
 # Pets
 # =============================================================================
+class PetQuerySet(models.QuerySet):
+    def reindexar_busca(self):
+        """Recalcula o search_vector (nome > raça > descrição) em um único UPDATE."""
+        return self.update(
+            search_vector=(
+                SearchVector("nome", weight="A", config=BUSCA_CONFIG)
+                + SearchVector("raca", weight="B", config=BUSCA_CONFIG)
+                + SearchVector("descricao", weight="C", config=BUSCA_CONFIG)
+            )
+        )
+
+    def buscar(self, termo):
+        """Busca full-text ranqueada usando o índice GIN de search_vector."""
+        consulta = SearchQuery(termo, config=BUSCA_CONFIG, search_type="websearch")
+        return (
+            self.filter(search_vector=consulta)
+            .annotate(rank=SearchRank(F("search_vector"), consulta))
+            .order_by("-rank", "-criado_em")
+        )
+
+
 class Pet(TimeStampedModel):
     ESPECIES = PET_SPECIES_CHOICES
     nome = models.CharField(max_length=80)
@@ -154,12 +288,32 @@ class Pet(TimeStampedModel):
         help_text="Gerado automaticamente a partir do nome.",
     )
 
+    # mantido por save() / PetQuerySet.reindexar_busca()
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = PetQuerySet.as_manager()
+
+    # campos que alimentam o search_vector
+    CAMPOS_BUSCA = ("nome", "raca", "descricao")
+
     class Meta:
         ordering = ("-criado_em",)
         indexes = [
             models.Index(fields=["especie"]),
             models.Index(fields=["adotado"]),
             models.Index(fields=["slug"]),
+            GinIndex(fields=["search_vector"], name="pet_search_vector_gin"),
+            # listagem padrão (/adotar/) só mostra disponíveis, mais recentes primeiro
+            models.Index(
+                fields=["-criado_em"],
+                condition=models.Q(adotado=False),
+                name="pet_disp_recente_idx",
+            ),
+            models.Index(
+                fields=["especie", "-criado_em"],
+                condition=models.Q(adotado=False),
+                name="pet_disp_especie_recente_idx",
+            ),
         ]
         # veja comentário em clean() se quiser forçar XOR entre tutor/ong
 
@@ -171,7 +325,14 @@ class Pet(TimeStampedModel):
             base = slugify(self.nome) or "pet"
             # UUID curto para garantir unicidade global
             self.slug = f"{base}-{uuid.uuid4().hex[:6]}"
-        super().save(*args, **kwargs)
+        # atomic: os contadores da ONG (signals.pet_salvo) entram na mesma transação
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+            # só reindexa quando algum campo textual pode ter mudado
+            update_fields = kwargs.get("update_fields")
+            if update_fields is None or set(update_fields) & set(self.CAMPOS_BUSCA):
+                Pet.objects.filter(pk=self.pk).reindexar_busca()
 
     def get_absolute_url(self):
         return reverse("amigofiel:perfil-pet", kwargs={"handle": self.slug})
@@ -193,6 +354,43 @@ class Pet(TimeStampedModel):
 # =============================================================================
 # Produtos de empresas
 # =============================================================================
+def _vetor_busca_produto():
+    return (
+        SearchVector("nome", weight="A", config=BUSCA_CONFIG)
+        + SearchVector("descricao_curta", weight="B", config=BUSCA_CONFIG)
+        + SearchVector("search_document", weight="C", config=BUSCA_CONFIG)
+    )
+
+
+class ProdutoQuerySet(models.QuerySet):
+    def reindexar_busca(self):
+        """Reconstrói search_document (ex.: após renomear a empresa) e o search_vector."""
+        produtos = list(self.select_related("empresa", "empresa__user"))
+        for produto in produtos:
+            produto.search_document = produto.montar_documento_busca()
+        ProdutoEmpresa.objects.bulk_update(produtos, ["search_document"], batch_size=500)
+        return self.update(search_vector=_vetor_busca_produto())
+
+    def buscar(self, termo):
+        """
+        Busca ranqueada: full-text (GIN em search_vector) OU similaridade de
+        trigramas no documento (GIN gin_trgm_ops), que tolera erros de digitação.
+        """
+        termo_norm = normalizar_busca(termo)
+        consulta = SearchQuery(termo, config=BUSCA_CONFIG, search_type="websearch")
+        return (
+            self.filter(
+                models.Q(search_vector=consulta) |
+                models.Q(search_document__trigram_word_similar=termo_norm)
+            )
+            .annotate(
+                rank=SearchRank(F("search_vector"), consulta)
+                + TrigramWordSimilarity(termo_norm, "search_document")
+            )
+            .order_by("-rank", "nome")
+        )
+
+
 class ProdutoEmpresa(TimeStampedModel):
     empresa = models.ForeignKey(
         UsuarioEmpresarial, on_delete=models.CASCADE, related_name="produtos"
@@ -220,6 +418,15 @@ class ProdutoEmpresa(TimeStampedModel):
         default="defaults/produto.png",
     )
 
+    # Documento de busca desnormalizado (produto + categoria + empresa), sem acentos
+    search_document = models.TextField(blank=True, default="", editable=False)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = ProdutoQuerySet.as_manager()
+
+    # campos que alimentam o documento de busca
+    CAMPOS_BUSCA = ("nome", "descricao_curta", "categoria", "empresa")
+
     class Meta:
         ordering = ("nome",)
         constraints = [
@@ -232,11 +439,34 @@ class ProdutoEmpresa(TimeStampedModel):
             models.Index(fields=["slug"]),
             models.Index(fields=["categoria"]),
             models.Index(fields=["ativo"]),
+            GinIndex(fields=["search_vector"], name="produto_search_vector_gin"),
+            GinIndex(
+                fields=["search_document"],
+                name="produto_search_doc_trgm",
+                opclasses=["gin_trgm_ops"],
+            ),
+            # paginação keyset de /produtos/ (só ativos por padrão)
+            models.Index(
+                fields=["nome", "id"],
+                condition=models.Q(ativo=True),
+                name="produto_ativo_nome_id_idx",
+            ),
         ]
 
     def __str__(self):
         return f"{self.nome} - {self.empresa.razao_social}"
 
+    def montar_documento_busca(self):
+        categoria = dict(PRODUTO_CATEGORIAS_CHOICES).get(self.categoria, self.categoria)
+        partes = [
+            self.nome,
+            self.descricao_curta,
+            categoria,
+            self.empresa.razao_social,
+            self.empresa.user.username,
+        ]
+        return normalizar_busca(" ".join(p for p in partes if p))
+
     def save(self, *args, **kwargs):
         # Gera slug único POR empresa
         if not self.slug:
@@ -249,7 +479,19 @@ class ProdutoEmpresa(TimeStampedModel):
                 slug = base[: 120 - len(suffix)] + suffix
                 i += 1
             self.slug = slug
-        super().save(*args, **kwargs)
+
+        update_fields = kwargs.get("update_fields")
+        reindexar = update_fields is None or bool(set(update_fields) & set(self.CAMPOS_BUSCA))
+        if reindexar:
+            self.search_document = self.montar_documento_busca()
+            if update_fields is not None:
+                kwargs["update_fields"] = set(update_fields) | {"search_document"}
+        # atomic: os contadores da empresa (signals.produto_salvo) entram na mesma transação
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+            if reindexar:
+                ProdutoEmpresa.objects.filter(pk=self.pk).update(search_vector=_vetor_busca_produto())
 
     def get_absolute_url(self):
     # /<empresa_handle>/<produto_slug>/
@@ -315,6 +557,11 @@ class ProdutoOngVinculo(TimeStampedModel):
     def __str__(self):
         return f"{self.produto.nome} → {self.ong.nome_fantasia} ({self.percentual}%)"
 
+    def save(self, *args, **kwargs):
+        # atomic: os contadores da empresa (signals.vinculo_alterado) entram na mesma transação
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
 
 # --- Carrinho ---
 class Carrinho(TimeStampedModel):
@@ -397,6 +644,321 @@ class ItemPedido(TimeStampedModel):
     def __str__(self):
         return f"{self.quantidade}x {self.produto.nome} (Pedido #{self.pedido_id})"
 
+class VendaDiariaQuerySet(models.QuerySet):
+    def acumular(self, itens, dia):
+        """
+        Soma os ItemPedido recém-criados às linhas (empresa, ong, produto, dia).
+        Chamado dentro da transação do checkout, com os produtos já travados
+        (select_for_update): nenhum outro checkout mexe nas mesmas linhas.
+        """
+        deltas = {}
+        for item in itens:
+            chave = (item.empresa_id, item.ong_id, item.produto_id)
+            d = deltas.setdefault(chave, [0, 0, Decimal("0.00"), Decimal("0.00")])
+            d[0] += item.quantidade
+            d[1] += 1
+            d[2] += item.total
+            d[3] += item.valor_doacao
+        if not deltas:
+            return
+
+        existentes = {
+            (v.empresa_id, v.ong_id, v.produto_id): v
+            for v in self.filter(dia=dia, produto_id__in={c[2] for c in deltas})
+        }
+        novos, alterados = [], []
+        for chave, (qtd, n, receita, doacao) in deltas.items():
+            linha = existentes.get(chave)
+            if linha is None:
+                novos.append(self.model(
+                    empresa_id=chave[0], ong_id=chave[1], produto_id=chave[2], dia=dia,
+                    quantidade=qtd, itens=n, receita=receita, doacao=doacao,
+                ))
+            else:
+                linha.quantidade += qtd
+                linha.itens += n
+                linha.receita += receita
+                linha.doacao += doacao
+                alterados.append(linha)
+        if novos:
+            self.bulk_create(novos)
+        if alterados:
+            self.bulk_update(alterados, ["quantidade", "itens", "receita", "doacao"])
+
+    def recalcular(self, chaves):
+        """
+        Refaz a partir de ItemPedido só as linhas das chaves
+        (empresa_id, ong_id, produto_id, dia) dadas. Usado quando um item é
+        editado ou apagado fora do checkout (admin, exclusão do pedido).
+        """
+        for empresa_id, ong_id, produto_id, dia in chaves:
+            filtro = {"empresa_id": empresa_id, "produto_id": produto_id, "dia": dia}
+            filtro.update({"ong_id": ong_id} if ong_id else {"ong__isnull": True})
+            a = (
+                ItemPedido.objects
+                .annotate(dia=TruncDate("criado_em"))
+                .filter(**filtro)
+                .aggregate(
+                    qtd=Sum("quantidade"), n=Count("id"),
+                    soma_receita=Sum("total"), soma_doacao=Sum("valor_doacao"),
+                )
+            )
+            linhas = self.filter(**filtro)
+            if not a["n"]:
+                linhas.delete()
+                continue
+            valores = {
+                "quantidade": a["qtd"], "itens": a["n"],
+                "receita": a["soma_receita"] or Decimal("0.00"),
+                "doacao": a["soma_doacao"] or Decimal("0.00"),
+            }
+            if not linhas.update(**valores):
+                self.create(empresa_id=empresa_id, ong_id=ong_id, produto_id=produto_id, dia=dia, **valores)
+
+    def reconstruir(self):
+        """Apaga e refaz todo o rollup a partir de ItemPedido. Retorna nº de linhas."""
+        self.all().delete()
+        agregado = (
+            ItemPedido.objects
+            .annotate(dia=TruncDate("criado_em"))
+            .values("empresa_id", "ong_id", "produto_id", "dia")
+            .annotate(
+                qtd=Sum("quantidade"), n=Count("id"),
+                soma_receita=Sum("total"), soma_doacao=Sum("valor_doacao"),
+            )
+            .order_by()
+        )
+        linhas = (
+            self.model(
+                empresa_id=a["empresa_id"], ong_id=a["ong_id"], produto_id=a["produto_id"],
+                dia=a["dia"], quantidade=a["qtd"], itens=a["n"],
+                receita=a["soma_receita"] or Decimal("0.00"),
+                doacao=a["soma_doacao"] or Decimal("0.00"),
+            )
+            for a in agregado.iterator()
+        )
+        total = 0
+        while lote := list(islice(linhas, 1000)):
+            self.bulk_create(lote)
+            total += len(lote)
+        return total
+
+
+class VendaDiaria(models.Model):
+    """
+    Rollup diário de ItemPedido por (empresa, ong, produto, dia). Os painéis
+    de empresa e ONG leem KPIs e séries daqui em vez de agregar os itens a
+    cada acesso. Mantido pelo checkout (itens novos) e pelos signals de
+    ItemPedido (edição/exclusão) e de UsuarioOng (exclusão);
+    `manage.py recalcular_vendas_diarias` reconstrói do zero.
+    """
+    empresa = models.ForeignKey(UsuarioEmpresarial, on_delete=models.CASCADE, related_name="vendas_diarias")
+    # CASCADE e não SET_NULL: anular ong_id colidiria com a linha "sem ONG" da
+    # mesma chave; os signals de UsuarioOng refazem essas linhas a partir dos itens
+    ong = models.ForeignKey(UsuarioOng, on_delete=models.CASCADE, null=True, blank=True, related_name="vendas_diarias")
+    produto = models.ForeignKey(ProdutoEmpresa, on_delete=models.CASCADE, related_name="vendas_diarias")
+    dia = models.DateField()
+
+    quantidade = models.PositiveIntegerField(default=0)
+    itens = models.PositiveIntegerField(default=0)  # nº de linhas de ItemPedido
+    receita = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+    doacao = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+
+    objects = VendaDiariaQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # ong é opcional: sem nulls_distinct=False cada item sem ONG viraria outra linha
+            models.UniqueConstraint(
+                fields=["empresa", "ong", "produto", "dia"], name="venda_diaria_chave_unica",
+                nulls_distinct=False,
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["empresa", "dia"], name="venda_diaria_empresa_dia_idx"),
+            models.Index(fields=["ong", "dia"], name="venda_diaria_ong_dia_idx"),
+            models.Index(fields=["produto", "dia"], name="venda_diaria_produto_dia_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.dia} · {self.produto_id} · {self.quantidade} un."
+
+
+class ProcessamentoImagemQuerySet(models.QuerySet):
+    def enfileirar(self, instancia, campo):
+        """
+        Registra o arquivo atual de ``instancia.<campo>`` para o worker
+        (``manage.py processar_imagens``). Chamado pelo post_save (em Pet e
+        ProdutoEmpresa, dentro do atomic() do save); o worker só enxerga a
+        tarefa depois do commit. Arquivo já registrado não gera tarefa nova.
+        """
+        arquivo = getattr(instancia, campo)
+        if not arquivo:
+            return
+        self.bulk_create([self.model(
+            nome=arquivo.name,
+            modelo=instancia._meta.label,
+            objeto_id=instancia.pk,
+            campo=campo,
+        )], ignore_conflicts=True)
+
+    def pegar_lote(self, n, travada_ha):
+        """
+        Trava até ``n`` tarefas disponíveis (FOR UPDATE SKIP LOCKED: vários
+        workers não pegam a mesma) e marca como "processando". Tarefas presas
+        em "processando" há mais de ``travada_ha`` (worker morreu) voltam à fila.
+        """
+        agora = timezone.now()
+        with transaction.atomic():
+            tarefas = list(
+                self.select_for_update(skip_locked=True)
+                .filter(
+                    models.Q(status=self.model.PENDENTE, disponivel_em__lte=agora)
+                    | models.Q(status=self.model.PROCESSANDO, atualizado_em__lt=agora - travada_ha)
+                )
+                .order_by("disponivel_em", "id")[:n]
+            )
+            if tarefas:
+                self.filter(pk__in=[t.pk for t in tarefas]).update(
+                    status=self.model.PROCESSANDO, atualizado_em=agora,
+                    tentativas=F("tentativas") + 1,
+                )
+                for t in tarefas:
+                    t.status = self.model.PROCESSANDO
+                    t.tentativas += 1
+        return tarefas
+
+
+class ProcessamentoImagem(models.Model):
+    """
+    Fila (no próprio banco) do processamento de uploads de imagem — validação,
+    redução do original e geração dos derivados (AmigoFiel/imagens.py) — e,
+    depois de concluída, o registro "arquivo -> SHA-256" que a tag
+    ``miniatura`` usa para achar os derivados. Até lá a página mostra um
+    placeholder.
+    """
+    PENDENTE, PROCESSANDO, CONCLUIDA, FALHOU = "pendente", "processando", "concluida", "falhou"
+    STATUS_CHOICES = [
+        (PENDENTE, "Pendente"),
+        (PROCESSANDO, "Processando"),
+        (CONCLUIDA, "Concluída"),
+        (FALHOU, "Falhou"),
+    ]
+
+    nome = models.CharField(max_length=255, unique=True)  # caminho do arquivo no storage
+    modelo = models.CharField(max_length=100)  # app_label.Model
+    objeto_id = models.PositiveBigIntegerField()
+    campo = models.CharField(max_length=50)
+
+    status = models.CharField(max_length=12, choices=STATUS_CHOICES, default=PENDENTE)
+    tentativas = models.PositiveSmallIntegerField(default=0)
+    erro = models.TextField(blank=True, default="")
+    sha256 = models.CharField(max_length=64, blank=True, default="")
+
+    disponivel_em = models.DateTimeField(default=timezone.now)
+    criado_em = models.DateTimeField(auto_now_add=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    objects = ProcessamentoImagemQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["disponivel_em", "id"], name="procimg_fila_idx",
+                condition=models.Q(status__in=["pendente", "processando"]),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.nome} ({self.status})"
+
+
+# campos de arquivo cujas linhas contam como referência a um ArquivoMidia
+CAMPOS_DE_ARQUIVO = (
+    ("AmigoFiel.Pet", "imagem"),
+    ("AmigoFiel.ProdutoEmpresa", "imagem"),
+    ("AmigoFiel.UsuarioComum", "foto"),
+    ("AmigoFiel.UsuarioEmpresarial", "foto"),
+    ("AmigoFiel.UsuarioEmpresarial", "banner"),
+    ("AmigoFiel.UsuarioOng", "foto"),
+    ("AmigoFiel.UsuarioOng", "banner"),
+)
+
+
+class ArquivoMidiaQuerySet(models.QuerySet):
+    def registrar(self, nome, sha256, tamanho):
+        """
+        Cria a linha do arquivo (0 referências) ou, se já existir, renova
+        ``atualizado_em``: um upload repetido de um arquivo sem referência
+        volta a ter a carência inteira antes do ``limpar_midia``.
+        """
+        self.bulk_create(
+            [self.model(nome=nome, sha256=sha256, tamanho=tamanho)],
+            update_conflicts=True, unique_fields=["nome"], update_fields=["atualizado_em"],
+        )
+
+    def ajustar(self, deltas):
+        """Soma ``{nome: delta}`` às referências. Nomes fora do storage por conteúdo são ignorados."""
+        from .storage import sha256_do_nome
+        for nome, delta in deltas.items():
+            if delta and sha256_do_nome(nome):
+                self.filter(nome=nome).update(
+                    referencias=F("referencias") + delta, atualizado_em=timezone.now(),
+                )
+
+    def contar_referencias(self, nomes=None):
+        """{nome: nº de linhas que apontam para ele} somando todos os campos de arquivo."""
+        from django.apps import apps
+        contagem = {}
+        for rotulo, campo in CAMPOS_DE_ARQUIVO:
+            qs = apps.get_model(rotulo).objects.all()
+            if nomes is not None:
+                qs = qs.filter(**{f"{campo}__in": nomes})
+            for nome, n in qs.values_list(campo).annotate(n=Count("pk")).order_by():
+                if nome:
+                    contagem[nome] = contagem.get(nome, 0) + n
+        return contagem
+
+    def recontar(self):
+        """Refaz as referências de todos os arquivos a partir das linhas. Retorna nº alterado."""
+        contagem = self.contar_referencias()
+        alterados = []
+        for arquivo in self.iterator():
+            certo = contagem.get(arquivo.nome, 0)
+            if arquivo.referencias != certo:
+                arquivo.referencias = certo
+                alterados.append(arquivo)
+        self.bulk_update(alterados, ["referencias"], batch_size=500)
+        return len(alterados)
+
+
+class ArquivoMidia(models.Model):
+    """
+    Um arquivo do storage endereçado por conteúdo (AmigoFiel/storage.py) e
+    quantas linhas o usam. Uploads repetidos apontam para o mesmo arquivo;
+    com zero referências ele vira candidato a ``manage.py limpar_midia``.
+    """
+    nome = models.CharField(max_length=100, unique=True)
+    sha256 = models.CharField(max_length=64, db_index=True)
+    tamanho = models.PositiveBigIntegerField(default=0)
+    referencias = models.IntegerField(default=0)
+    criado_em = models.DateTimeField(auto_now_add=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    objects = ArquivoMidiaQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["atualizado_em"], name="arquivo_midia_orfao_idx",
+                condition=models.Q(referencias__lte=0),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.nome} ({self.referencias} ref.)"
+
+
 # dentro de ProdutoEmpresa
 def ong_beneficiada(self):
     v = self.vinculos_ong.filter(ativo=True).order_by("-percentual").first()
@@ -0,0 +1,189 @@
+# AmigoFiel/paginacao.py
+"""
+Paginação por cursor (keyset) para as listagens públicas.
+
+Em vez de ``OFFSET n`` + ``COUNT(*)`` (Paginator do Django), cada página é
+buscada a partir dos valores da ordenação do último/primeiro item da página
+anterior: ``WHERE (criado_em, id) "depois de" (v1, v2) ORDER BY ... LIMIT n``.
+O custo é o mesmo na página 1 e na página 400.
+
+O ``rank`` da busca é float4 no Postgres: comparado com o float8 que volta
+do cursor ele não casa na igualdade e erra na fronteira. Por isso a busca
+pagina por ``rank_cursor`` — o rank convertido para numeric(12, 6), que
+vai e volta pelo cursor sem perder nada.
+"""
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core import signing
+from django.db import DatabaseError
+from django.db.models import DecimalField, F, Q
+from django.db.models.functions import Cast
+
+
+class CursorPage:
+    """Página de resultados com a mesma "cara" de Page para os templates."""
+
+    def __init__(self, object_list, has_next, has_previous,
+                 next_cursor=None, previous_cursor=None, total=None, total_aproximado=False):
+        self.object_list = object_list
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.total = total
+        self.total_aproximado = total_aproximado
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+
+def _serializar(valor):
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return str(valor)
+    return valor
+
+
+def _inverter(campo):
+    return campo[1:] if campo.startswith("-") else f"-{campo}"
+
+
+def _filtro_cursor(ordering, valores, para_tras=False):
+    """
+    Expande a comparação de tupla em ORs, o que permite ordenações com
+    direções mistas (ex.: ``-criado_em, id``):
+    ``c1 > v1 OR (c1 = v1 AND c2 > v2) OR ...``
+    """
+    condicao = Q()
+    igualdade = {}
+    for campo, valor in zip(ordering, valores):
+        nome = campo.lstrip("-")
+        desc = campo.startswith("-")
+        op = "lt" if desc != para_tras else "gt"
+        condicao |= Q(**igualdade, **{f"{nome}__{op}": valor})
+        igualdade[nome] = valor
+    return condicao
+
+
+class CursorPaginationMixin:
+    """
+    Mixin para ListView: troca o Paginator (OFFSET/COUNT) por paginação keyset.
+
+    ``cursor_ordering`` deve terminar em uma coluna única (normalmente ``id``)
+    e não pode conter valores nulos. O total exibido é, por padrão, a
+    estimativa do planejador (EXPLAIN); abaixo de ``cursor_contagem_exata_ate``
+    faz o COUNT de verdade, que nesse tamanho é barato.
+    """
+    cursor_ordering = ("-criado_em", "id")
+    cursor_param = "cursor"
+    cursor_salt = "amigofiel.paginacao"
+    cursor_estimar_total = True
+    cursor_contagem_exata_ate = 1000
+
+    def get_cursor_ordering(self, queryset):
+        # resultados de .buscar() vêm anotados com "rank": pagina por relevância
+        if "rank" in queryset.query.annotations:
+            return ("-rank_cursor", "id")
+        return tuple(self.cursor_ordering)
+
+    def preparar_queryset_cursor(self, queryset):
+        if "rank" in queryset.query.annotations and "rank_cursor" not in queryset.query.annotations:
+            queryset = queryset.annotate(
+                rank_cursor=Cast(F("rank"), DecimalField(max_digits=12, decimal_places=6))
+            )
+        return queryset
+
+    def _ler_cursor(self, ordering):
+        token = self.request.GET.get(self.cursor_param)
+        if not token:
+            return None
+        try:
+            cursor = signing.loads(token, salt=self.cursor_salt)
+        except signing.BadSignature:
+            return None
+        # cursor de outra ordenação (ex.: busca vs. listagem) é ignorado
+        if cursor.get("o") != list(ordering) or len(cursor.get("v") or []) != len(ordering):
+            return None
+        return cursor
+
+    def _gerar_cursor(self, obj, ordering, direcao, total=None, aproximado=False):
+        valores = [_serializar(getattr(obj, campo.lstrip("-"))) for campo in ordering]
+        return signing.dumps(
+            # "t": total já estimado na página 1; as seguintes não repetem o EXPLAIN
+            {"o": list(ordering), "v": valores, "d": direcao, "t": [total, aproximado]},
+            salt=self.cursor_salt,
+            compress=True,
+        )
+
+    def estimar_total(self, queryset):
+        """
+        Retorna (total, aproximado). O COUNT exato só roda quando a estimativa
+        é pequena; acima de ``cursor_contagem_exata_ate`` fica a estimativa.
+        """
+        try:
+            plano = json.loads(queryset.order_by().explain(format="json"))
+        except DatabaseError:
+            return None, False
+        if isinstance(plano, list):
+            plano = plano[0]
+        estimado = int(plano["Plan"]["Plan Rows"])
+        if estimado > self.cursor_contagem_exata_ate:
+            return estimado, True
+        return queryset.count(), False
+
+    def paginate_queryset(self, queryset, page_size):
+        queryset = self.preparar_queryset_cursor(queryset)
+        ordering = self.get_cursor_ordering(queryset)
+        cursor = self._ler_cursor(ordering)
+        para_tras = bool(cursor) and cursor.get("d") == "p"
+
+        qs = queryset
+        if cursor:
+            qs = qs.filter(_filtro_cursor(ordering, cursor["v"], para_tras))
+        ordem = [_inverter(c) for c in ordering] if para_tras else list(ordering)
+
+        linhas = list(qs.order_by(*ordem)[: page_size + 1])
+        tem_mais = len(linhas) > page_size
+        linhas = linhas[:page_size]
+        if para_tras:
+            linhas.reverse()
+            has_previous, has_next = tem_mais, True
+        else:
+            has_previous, has_next = cursor is not None, tem_mais
+
+        total, aproximado = (None, False)
+        if cursor and cursor.get("t"):
+            total, aproximado = cursor["t"]
+        elif self.cursor_estimar_total:
+            total, aproximado = self.estimar_total(queryset)
+
+        page = CursorPage(
+            linhas,
+            has_next=has_next and bool(linhas),
+            has_previous=has_previous and bool(linhas),
+            next_cursor=(self._gerar_cursor(linhas[-1], ordering, "n", total, aproximado)
+                         if has_next and linhas else None),
+            previous_cursor=(self._gerar_cursor(linhas[0], ordering, "p", total, aproximado)
+                             if has_previous and linhas else None),
+            total=total,
+            total_aproximado=aproximado,
+        )
+        return (None, page, page.object_list, page.has_other_pages())
@@ -0,0 +1,239 @@
+# AmigoFiel/signals.py
+"""
+Mantém os contadores desnormalizados de UsuarioOng / UsuarioEmpresarial e
+invalida as seções em cache da home (cache_home) e os cartões de usuário
+(cartoes). Também põe os uploads de imagem na fila de processamento e
+mantém as referências de ArquivoMidia (storage endereçado por conteúdo).
+
+Cada alteração recalcula apenas os perfis afetados com um UPDATE de
+subqueries, então não há deriva como em incrementos "+1/-1". O recálculo
+roda na mesma transação do save/delete que o disparou: o save() de Pet,
+ProdutoEmpresa e ProdutoOngVinculo abre um ``transaction.atomic()`` e o
+delete() do Django já é atômico com os post_delete.
+"""
+from django.contrib.auth import get_user_model
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import cache_home, cartoes
+from .models import (
+    ArquivoMidia, ItemPedido, Pet, ProcessamentoImagem, ProdutoEmpresa, ProdutoOngVinculo,
+    UsuarioComum, UsuarioEmpresarial, UsuarioOng, VendaDiaria,
+)
+
+
+def _afeta(update_fields, campos):
+    return update_fields is None or bool(set(update_fields) & set(campos))
+
+
+# --------- Pets -> UsuarioOng ---------
+@receiver(post_init, sender=Pet)
+def pet_guardar_ong_original(sender, instance, **kwargs):
+    instance._ong_id_original = instance.ong_id
+
+
+@receiver(post_save, sender=Pet)
+def pet_salvo(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or not _afeta(update_fields, ("ong", "adotado")):
+        return
+    ids = {instance.ong_id, instance._ong_id_original} - {None}
+    if ids:
+        UsuarioOng.objects.filter(pk__in=ids).recalcular_contadores()
+    instance._ong_id_original = instance.ong_id
+
+
+@receiver(post_delete, sender=Pet)
+def pet_removido(sender, instance, **kwargs):
+    if instance.ong_id:
+        UsuarioOng.objects.filter(pk=instance.ong_id).recalcular_contadores()
+
+
+# --------- Produtos / vínculos -> UsuarioEmpresarial ---------
+@receiver(post_init, sender=ProdutoEmpresa)
+def produto_guardar_empresa_original(sender, instance, **kwargs):
+    instance._empresa_id_original = instance.empresa_id
+
+
+@receiver(post_save, sender=ProdutoEmpresa)
+def produto_salvo(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or not _afeta(update_fields, ("empresa", "ativo")):
+        return
+    ids = {instance.empresa_id, instance._empresa_id_original} - {None}
+    UsuarioEmpresarial.objects.filter(pk__in=ids).recalcular_contadores()
+    instance._empresa_id_original = instance.empresa_id
+
+
+@receiver(post_delete, sender=ProdutoEmpresa)
+def produto_removido(sender, instance, **kwargs):
+    UsuarioEmpresarial.objects.filter(pk=instance.empresa_id).recalcular_contadores()
+
+
+@receiver(post_save, sender=ProdutoOngVinculo)
+@receiver(post_delete, sender=ProdutoOngVinculo)
+def vinculo_alterado(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    UsuarioEmpresarial.objects.filter(produtos__pk=instance.produto_id).recalcular_contadores()
+
+
+# --------- User -> busca de produtos e cache da home ---------
+# o username da empresa entra no search_document dos produtos
+# (ProdutoQuerySet.reindexar_busca); a razão social é tratada no save() dela
+@receiver(post_init, sender=get_user_model())
+def user_guardar_username_original(sender, instance, **kwargs):
+    instance._username_original = instance.__dict__.get("username")
+
+
+@receiver(post_save, sender=get_user_model())
+def user_salvo(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    if raw or created or not _afeta(update_fields, ("username",)):
+        return
+    if instance.username != instance._username_original:
+        ProdutoEmpresa.objects.filter(empresa__user=instance).reindexar_busca()
+        # os blocos da home guardam o username nos links de perfil e de produto
+        transaction.on_commit(lambda: cache_home.invalidar("produtos", "lojas", "ongs"))
+    instance._username_original = instance.username
+
+
+# --------- ItemPedido -> VendaDiaria ---------
+# O checkout cria os itens com bulk_create (sem signals) e acumula o rollup
+# ele mesmo; aqui entram só as edições e exclusões (admin, pedido apagado).
+def _venda_chave(item):
+    return (item.empresa_id, item.ong_id, item.produto_id, timezone.localdate(item.criado_em))
+
+
+@receiver(post_init, sender=ItemPedido)
+def item_guardar_chave_original(sender, instance, **kwargs):
+    instance._venda_chave_original = _venda_chave(instance) if instance.criado_em else None
+
+
+@receiver(post_save, sender=ItemPedido)
+def item_salvo(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    chaves = {_venda_chave(instance), instance._venda_chave_original} - {None}
+    VendaDiaria.objects.recalcular(chaves)
+    instance._venda_chave_original = _venda_chave(instance)
+
+
+@receiver(post_delete, sender=ItemPedido)
+def item_removido(sender, instance, **kwargs):
+    VendaDiaria.objects.recalcular({_venda_chave(instance)})
+
+
+# ONG apagada: as linhas dela caem em CASCADE e os itens ficam sem ONG
+# (SET_NULL), então as chaves "sem ONG" correspondentes são refeitas
+@receiver(pre_delete, sender=UsuarioOng)
+def ong_guardar_vendas(sender, instance, **kwargs):
+    instance._vendas_chaves = {
+        (empresa_id, None, produto_id, dia)
+        for empresa_id, produto_id, dia in instance.vendas_diarias.values_list("empresa_id", "produto_id", "dia")
+    }
+
+
+@receiver(post_delete, sender=UsuarioOng)
+def ong_removida(sender, instance, **kwargs):
+    VendaDiaria.objects.recalcular(getattr(instance, "_vendas_chaves", ()))
+
+
+# --------- Cache da home ---------
+@receiver(post_save, sender=Pet)
+@receiver(post_delete, sender=Pet)
+@receiver(post_save, sender=ProdutoEmpresa)
+@receiver(post_delete, sender=ProdutoEmpresa)
+@receiver(post_save, sender=UsuarioEmpresarial)
+@receiver(post_delete, sender=UsuarioEmpresarial)
+@receiver(post_save, sender=UsuarioOng)
+@receiver(post_delete, sender=UsuarioOng)
+def invalidar_cache_home(sender, **kwargs):
+    secoes = cache_home.SECOES_POR_MODELO[sender.__name__]
+    # depois do commit: antes disso outra requisição poderia recachear o dado antigo
+    transaction.on_commit(lambda: cache_home.invalidar(*secoes))
+
+
+# --------- Cartões de exibição ---------
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def invalidar_cartao_usuario(sender, instance, **kwargs):
+    transaction.on_commit(lambda: cartoes.invalidar(instance.pk))
+
+
+@receiver(post_save, sender=UsuarioComum)
+@receiver(post_delete, sender=UsuarioComum)
+@receiver(post_save, sender=UsuarioEmpresarial)
+@receiver(post_delete, sender=UsuarioEmpresarial)
+@receiver(post_save, sender=UsuarioOng)
+@receiver(post_delete, sender=UsuarioOng)
+def invalidar_cartao_perfil(sender, instance, **kwargs):
+    transaction.on_commit(lambda: cartoes.invalidar(instance.user_id))
+
+
+# --------- Fila de processamento de imagens ---------
+@receiver(post_save, sender=Pet)
+@receiver(post_save, sender=ProdutoEmpresa)
+@receiver(post_save, sender=UsuarioComum)
+@receiver(post_save, sender=UsuarioEmpresarial)
+@receiver(post_save, sender=UsuarioOng)
+def enfileirar_imagens(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    # conectado antes de arquivos_salvos: _arquivos_originais ainda tem os
+    # nomes de antes deste save, e só arquivo novo vai para a fila
+    originais = {} if created else instance._arquivos_originais
+    for field in sender._meta.get_fields():
+        if (isinstance(field, models.ImageField) and _afeta(update_fields, (field.name,))
+                and getattr(instance, field.name).name != originais.get(field.name, "")):
+            ProcessamentoImagem.objects.enfileirar(instance, field.name)
+
+
+# --------- Referências de ArquivoMidia ---------
+def _arquivos_atuais(instance):
+    return {
+        f.name: getattr(instance, f.name).name or ""
+        for f in instance._meta.get_fields() if isinstance(f, models.FileField)
+    }
+
+
+@receiver(post_init, sender=Pet)
+@receiver(post_init, sender=ProdutoEmpresa)
+@receiver(post_init, sender=UsuarioComum)
+@receiver(post_init, sender=UsuarioEmpresarial)
+@receiver(post_init, sender=UsuarioOng)
+def arquivos_guardar_originais(sender, instance, **kwargs):
+    instance._arquivos_originais = _arquivos_atuais(instance)
+
+
+@receiver(post_save, sender=Pet)
+@receiver(post_save, sender=ProdutoEmpresa)
+@receiver(post_save, sender=UsuarioComum)
+@receiver(post_save, sender=UsuarioEmpresarial)
+@receiver(post_save, sender=UsuarioOng)
+def arquivos_salvos(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    originais = {} if created else instance._arquivos_originais
+    # com update_fields, campos de arquivo fora da lista não foram gravados:
+    # continuam com o nome original no banco e na foto
+    salvos = {c: n for c, n in _arquivos_atuais(instance).items() if _afeta(update_fields, (c,))}
+    deltas = {}
+    for campo, nome in salvos.items():
+        antigo = originais.get(campo, "")
+        if nome != antigo:
+            deltas[nome] = deltas.get(nome, 0) + 1
+            deltas[antigo] = deltas.get(antigo, 0) - 1
+    ArquivoMidia.objects.ajustar(deltas)
+    instance._arquivos_originais = {**originais, **salvos}
+
+
+@receiver(post_delete, sender=Pet)
+@receiver(post_delete, sender=ProdutoEmpresa)
+@receiver(post_delete, sender=UsuarioComum)
+@receiver(post_delete, sender=UsuarioEmpresarial)
+@receiver(post_delete, sender=UsuarioOng)
+def arquivos_removidos(sender, instance, **kwargs):
+    deltas = {}
+    for nome in instance._arquivos_originais.values():
+        deltas[nome] = deltas.get(nome, 0) - 1
+    ArquivoMidia.objects.ajustar(deltas)
@@ -0,0 +1,63 @@
+# AmigoFiel/storage.py
+"""
+Storage endereçado por conteúdo para a mídia enviada pelos usuários.
+
+Todo arquivo salvo vira ``arquivos/ab/cd/<sha256>.<ext>``: o nome pedido
+pelo ``upload_to`` só contribui com a extensão. Dois uploads iguais (fotos
+repetidas, dados de demonstração) resolvem para o mesmo nome e o segundo
+não grava nada. Cada arquivo tem uma linha em ArquivoMidia com o número de
+linhas do banco que apontam para ele, mantido pelos signals; o
+``manage.py limpar_midia`` apaga os que ficaram sem referência.
+
+Nomes em ``derivados/`` (AmigoFiel/imagens.py) já são derivados do hash e
+passam direto.
+"""
+import hashlib
+import os
+import re
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+PASTA = "arquivos"
+_NOME_CAS = re.compile(rf"^{PASTA}/[0-9a-f]{{2}}/[0-9a-f]{{2}}/([0-9a-f]{{64}})\.\w+$")
+_EXTENSOES_EQUIVALENTES = {".jpeg": ".jpg", ".jpe": ".jpg"}
+
+
+def sha256_do_nome(nome):
+    """SHA-256 embutido em um nome do storage, ou None se não for um deles."""
+    m = _NOME_CAS.match(nome or "")
+    return m.group(1) if m else None
+
+
+@deconstructible
+class ArmazenamentoPorConteudo(FileSystemStorage):
+    diretos = ("derivados/",)
+
+    def _save(self, name, content):
+        if name.startswith(self.diretos):
+            return super()._save(name, content)
+
+        h = hashlib.sha256()
+        if hasattr(content, "seek"):
+            content.seek(0)
+        for bloco in content.chunks():
+            h.update(bloco)
+        if hasattr(content, "seek"):
+            content.seek(0)
+        sha = h.hexdigest()
+
+        ext = os.path.splitext(name)[1].lower()
+        ext = _EXTENSOES_EQUIVALENTES.get(ext, ext)
+        nome = f"{PASTA}/{sha[:2]}/{sha[2:4]}/{sha}{ext}"
+        # registra antes de conferir o arquivo: se o limpar_midia estiver
+        # apagando este nome, o registrar espera o commit dele e o arquivo
+        # é gravado de novo logo abaixo
+        from .models import ArquivoMidia
+        ArquivoMidia.objects.registrar(nome, sha, content.size)
+        if not self.exists(nome):
+            salvo = super()._save(nome, content)
+            if salvo != nome:
+                # o mesmo conteúdo foi gravado por outro processo ao mesmo tempo
+                self.delete(salvo)
+        return nome
@@ -0,0 +1,15 @@
+# AmigoFiel/templatetags/imagens.py
+from django import template
+
+from AmigoFiel.imagens import url_derivado
+
+register = template.Library()
+
+
+@register.simple_tag
+def miniatura(campo, tamanho="card"):
+    """
+    URL do derivado reduzido de um ImageField:
+    ``<img src="{% miniatura pet.imagem 'card' %}">``. Campo vazio -> "".
+    """
+    return url_derivado(campo, tamanho)
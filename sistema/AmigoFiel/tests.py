@@ -1,3 +1,319 @@
-from django.test import TestCase
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.db import DatabaseError, connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from .checkout import EstoqueInsuficiente, finalizar_pedido
+from .midia import _faixa
+from .models import (
+    ArquivoMidia, Carrinho, ItemCarrinho, ItemPedido, OngQuerySet, Pedido, Pet, ProdutoEmpresa,
+    ProdutoOngVinculo, UsuarioEmpresarial, UsuarioOng, VendaDiaria,
+)
+from .views import ListarAnimais
+
+
+class PaginacaoCursorBuscaTests(TestCase):
+    """Busca paginada por rank: empates não podem repetir nem pular linhas."""
+
+    @classmethod
+    def setUpTestData(cls):
+        # mesmo texto -> mesmo rank para todos
+        for i in range(13):
+            Pet.objects.create(nome="Rex", especie="cachorro", descricao="cachorro dócil e brincalhão")
+        cls.ids = set(Pet.objects.values_list("pk", flat=True))
+
+    def _pagina(self, **params):
+        request = RequestFactory().get("/animais/", {"q": "rex", **params})
+        response = ListarAnimais.as_view(paginate_by=5)(request)
+        return response.context_data["page_obj"]
+
+    def test_percorre_todas_as_paginas_sem_repetir(self):
+        vistos = []
+        page = self._pagina()
+        self.assertEqual(page.total, 13)
+        while True:
+            vistos.extend(p.pk for p in page)
+            if not page.has_next():
+                break
+            page = self._pagina(cursor=page.next_cursor)
+        self.assertEqual(len(vistos), len(set(vistos)))
+        self.assertEqual(set(vistos), self.ids)
+
+    def test_volta_para_a_pagina_anterior(self):
+        primeira = self._pagina()
+        segunda = self._pagina(cursor=primeira.next_cursor)
+        de_volta = self._pagina(cursor=segunda.previous_cursor)
+        self.assertEqual([p.pk for p in de_volta], [p.pk for p in primeira])
+        # o total veio do cursor, sem novo EXPLAIN/COUNT
+        self.assertEqual(segunda.total, primeira.total)
+
+
+class ArquivoMidiaReferenciasTests(TestCase):
+    """Deltas de referência mantidos por arquivos_salvos / arquivos_removidos."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media = tempfile.mkdtemp()
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media))
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(cls.media, ignore_errors=True)
+
+    def setUp(self):
+        self.empresa = UsuarioEmpresarial(
+            user=User.objects.create_user("loja"), razao_social="Loja", cnpj="00.000.000/0001-00",
+        )
+        self.empresa.foto.save("a.jpg", ContentFile(b"aaa"), save=False)
+        self.empresa.save()
+
+    def _referencias(self):
+        return dict(ArquivoMidia.objects.values_list("nome", "referencias"))
+
+    def test_upload_repetido_aponta_para_o_mesmo_arquivo(self):
+        outra = UsuarioEmpresarial(user=User.objects.create_user("outra"), razao_social="Outra", cnpj="1")
+        outra.foto.save("copia.JPEG", ContentFile(b"aaa"), save=False)
+        outra.save()
+        self.assertEqual(outra.foto.name, self.empresa.foto.name)
+        self.assertEqual(self._referencias(), {self.empresa.foto.name: 2})
+
+    def test_troca_de_arquivo_move_a_referencia(self):
+        antigo = self.empresa.foto.name
+        self.empresa.foto.save("b.jpg", ContentFile(b"bbb"), save=True)
+        self.assertEqual(self._referencias(), {antigo: 0, self.empresa.foto.name: 1})
+
+    def test_update_fields_sem_o_arquivo_nao_conta_nem_esquece_o_original(self):
+        antigo = self.empresa.foto.name
+        self.empresa.foto.save("b.jpg", ContentFile(b"bbb"), save=False)
+        novo = self.empresa.foto.name
+        self.empresa.razao_social = "Loja 2"
+        self.empresa.save(update_fields=["razao_social"])
+        self.assertEqual(self._referencias(), {antigo: 1, novo: 0})
+        # o save completo depois ainda enxerga a troca
+        self.empresa.save()
+        self.assertEqual(self._referencias(), {antigo: 0, novo: 1})
+
+    def test_exclusao_solta_todas_as_referencias(self):
+        self.empresa.banner.save("c.jpg", ContentFile(b"aaa"), save=True)
+        self.assertEqual(self._referencias(), {self.empresa.foto.name: 2})
+        self.empresa.delete()
+        self.assertEqual(self._referencias(), {self.empresa.foto.name: 0})
+
+    def test_upload_repetido_renova_a_carencia_da_limpeza(self):
+        ArquivoMidia.objects.update(atualizado_em=timezone.now() - timedelta(days=3))
+        self.empresa.banner.save("d.jpg", ContentFile(b"aaa"), save=False)
+        arquivo = ArquivoMidia.objects.get()
+        self.assertGreater(arquivo.atualizado_em, timezone.now() - timedelta(hours=1))
+
+
+class CheckoutConcorrenteTests(TransactionTestCase):
+    """Dois checkouts ao mesmo tempo disputando a última unidade em estoque."""
+
+    def setUp(self):
+        empresa = UsuarioEmpresarial.objects.create(
+            user=User.objects.create_user("loja"), razao_social="Loja", cnpj="00.000.000/0001-00",
+        )
+        self.racao = ProdutoEmpresa.objects.create(empresa=empresa, nome="Ração", preco=Decimal("10.00"), estoque=1)
+        self.petisco = ProdutoEmpresa.objects.create(empresa=empresa, nome="Petisco", preco=Decimal("2.50"), estoque=5)
+        self.carrinhos = []
+        for nome in ("ana", "bia"):
+            cart = Carrinho.objects.create(user=User.objects.create_user(nome))
+            ItemCarrinho.objects.create(carrinho=cart, produto=self.petisco, quantidade=2)
+            ItemCarrinho.objects.create(carrinho=cart, produto=self.racao, quantidade=1)
+            self.carrinhos.append(cart)
+
+    def _finalizar_em_paralelo(self):
+        barreira = threading.Barrier(len(self.carrinhos))
+        resultados = []
+
+        def comprar(cart):
+            try:
+                barreira.wait()
+                resultados.append(finalizar_pedido(cart.user, cart))
+            except EstoqueInsuficiente as e:
+                resultados.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=comprar, args=(cart,)) for cart in self.carrinhos]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return resultados
+
+    def test_so_um_checkout_leva_a_ultima_unidade(self):
+        resultados = self._finalizar_em_paralelo()
+        pedidos = [r for r in resultados if isinstance(r, Pedido)]
+        falhas = [r for r in resultados if isinstance(r, EstoqueInsuficiente)]
+        self.assertEqual((len(pedidos), len(falhas)), (1, 1))
+        self.assertEqual([p.pk for p in falhas[0].produtos], [self.racao.pk])
+
+        self.racao.refresh_from_db()
+        self.petisco.refresh_from_db()
+        self.assertEqual((self.racao.estoque, self.petisco.estoque), (0, 3))
+        self.assertEqual(Pedido.objects.count(), 1)
+        # o checkout que falhou não gravou nada nem limpou o carrinho
+        self.assertEqual(ItemCarrinho.objects.count(), 2)
+        self.assertEqual(VendaDiaria.objects.get(produto=self.racao).quantidade, 1)
+
+
+class FaixaRangeTests(SimpleTestCase):
+    """Interpretação do cabeçalho Range em servir_midia."""
+
+    def test_faixas_validas(self):
+        self.assertEqual(_faixa("bytes=0-9", 100), (0, 9))
+        self.assertEqual(_faixa("bytes=90-", 100), (90, 99))
+        self.assertEqual(_faixa("bytes=90-500", 100), (90, 99))  # fim além do arquivo é cortado
+        self.assertEqual(_faixa("bytes=-5", 100), (95, 99))
+        self.assertEqual(_faixa("bytes=-500", 100), (0, 99))  # sufixo maior que o arquivo
+        self.assertEqual(_faixa(" bytes=99-99 ", 100), (99, 99))
+
+    def test_faixas_impossiveis_dao_416(self):
+        self.assertEqual(_faixa("bytes=100-", 100), "invalida")
+        self.assertEqual(_faixa("bytes=10-5", 100), "invalida")
+        self.assertEqual(_faixa("bytes=-0", 100), "invalida")
+        self.assertEqual(_faixa("bytes=-5", 0), "invalida")
+        self.assertEqual(_faixa("bytes=0-", 0), "invalida")
+
+    def test_cabecalhos_ignorados(self):
+        self.assertIsNone(_faixa("bytes=-", 100))
+        self.assertIsNone(_faixa("bytes=0-1,5-9", 100))  # várias faixas: resposta inteira
+        self.assertIsNone(_faixa("items=0-9", 100))
+
+
+class VendaDiariaTests(TestCase):
+    """Rollup diário mantido pelo checkout e pelos signals."""
+
+    def setUp(self):
+        self.empresa = UsuarioEmpresarial.objects.create(
+            user=User.objects.create_user("loja"), razao_social="Loja", cnpj="00.000.000/0001-00",
+        )
+        self.ong = UsuarioOng.objects.create(
+            user=User.objects.create_user("ong"), nome_fantasia="Patinhas", cnpj="11.111.111/0001-11",
+        )
+        self.racao = ProdutoEmpresa.objects.create(
+            empresa=self.empresa, nome="Ração", preco=Decimal("10.00"), estoque=50,
+        )
+        self.vinculo = ProdutoOngVinculo.objects.create(produto=self.racao, ong=self.ong, percentual=Decimal("10"))
+        self.cliente = User.objects.create_user("cliente")
+        self.cart = Carrinho.objects.create(user=self.cliente)
+
+    def _comprar(self, quantidade):
+        ItemCarrinho.objects.create(carrinho=self.cart, produto=self.racao, quantidade=quantidade)
+        return finalizar_pedido(self.cliente, self.cart)
+
+    def _linhas(self):
+        return list(VendaDiaria.objects.order_by("ong_id").values_list("ong_id", "quantidade", "itens", "receita"))
+
+    def _confere_com_reconstrucao(self):
+        linhas = self._linhas()
+        VendaDiaria.objects.reconstruir()
+        self.assertEqual(linhas, self._linhas())
+
+    def test_checkout_acumula_na_mesma_linha(self):
+        self._comprar(2)
+        self._comprar(3)
+        linha = VendaDiaria.objects.get()
+        self.assertEqual(
+            (linha.ong_id, linha.quantidade, linha.itens, linha.receita, linha.doacao),
+            (self.ong.pk, 5, 2, Decimal("50.00"), Decimal("5.00")),
+        )
+        self._confere_com_reconstrucao()
+
+    def test_editar_e_apagar_itens_refaz_a_linha(self):
+        self._comprar(2)
+        pedido = self._comprar(3)
+        item = pedido.itens.get()
+        item.quantidade, item.total = 4, Decimal("40.00")
+        item.save()
+        self.assertEqual(self._linhas(), [(self.ong.pk, 6, 2, Decimal("60.00"))])
+
+        item.delete()
+        self.assertEqual(self._linhas(), [(self.ong.pk, 2, 1, Decimal("20.00"))])
+        Pedido.objects.all().delete()
+        self.assertEqual(self._linhas(), [])
+
+    def test_apagar_ong_junta_as_vendas_na_linha_sem_ong(self):
+        self._comprar(1)
+        self.vinculo.delete()
+        self._comprar(2)  # mesmo produto e dia, agora sem ONG
+        self.assertEqual(len(self._linhas()), 2)
+
+        self.ong.user.delete()  # cascata até a ONG; itens ficam com ong NULL
+        self.assertEqual(self._linhas(), [(None, 3, 2, Decimal("30.00"))])
+        self.assertFalse(ItemPedido.objects.filter(ong__isnull=False).exists())
+        self._confere_com_reconstrucao()
+
+
+class ContadoresTests(TestCase):
+    """Contadores desnormalizados de ONG e empresa mantidos pelos signals."""
+
+    def setUp(self):
+        self.ong = UsuarioOng.objects.create(
+            user=User.objects.create_user("ong"), nome_fantasia="Patinhas", cnpj="11.111.111/0001-11",
+        )
+        self.outra = UsuarioOng.objects.create(
+            user=User.objects.create_user("outra"), nome_fantasia="Focinhos", cnpj="22.222.222/0001-22",
+        )
+        self.empresa = UsuarioEmpresarial.objects.create(
+            user=User.objects.create_user("loja"), razao_social="Loja", cnpj="00.000.000/0001-00",
+        )
+
+    def _pets(self, ong):
+        ong.refresh_from_db()
+        return ong.qtd_pets, ong.qtd_pets_disponiveis
+
+    def _produtos(self):
+        self.empresa.refresh_from_db()
+        e = self.empresa
+        return e.qtd_produtos, e.qtd_produtos_ativos, e.qtd_produtos_com_ong
+
+    def test_pets_cadastro_adocao_troca_de_ong_e_exclusao(self):
+        rex = Pet.objects.create(nome="Rex", especie="cachorro", ong=self.ong)
+        Pet.objects.create(nome="Mia", especie="gato", ong=self.ong)
+        self.assertEqual(self._pets(self.ong), (2, 2))
+
+        rex.adotado = True
+        rex.save(update_fields=["adotado"])
+        self.assertEqual(self._pets(self.ong), (2, 1))
+
+        rex.ong = self.outra
+        rex.save()
+        self.assertEqual((self._pets(self.ong), self._pets(self.outra)), ((1, 1), (1, 0)))
+
+        rex.delete()
+        self.assertEqual(self._pets(self.outra), (0, 0))
+
+    def test_produtos_ativos_e_vinculos(self):
+        racao = ProdutoEmpresa.objects.create(empresa=self.empresa, nome="Ração", preco=Decimal("10.00"))
+        ProdutoEmpresa.objects.create(empresa=self.empresa, nome="Coleira", preco=Decimal("5.00"), ativo=False)
+        self.assertEqual(self._produtos(), (2, 1, 0))
+
+        vinculo = ProdutoOngVinculo.objects.create(produto=racao, ong=self.ong, percentual=Decimal("5"))
+        self.assertEqual(self._produtos(), (2, 1, 1))
+        vinculo.delete()
+        self.assertEqual(self._produtos(), (2, 1, 0))
+
+        racao.ativo = False
+        racao.save(update_fields=["ativo"])
+        self.assertEqual(self._produtos(), (2, 0, 0))
+        racao.delete()
+        self.assertEqual(self._produtos(), (1, 0, 0))
+
+    def test_falha_no_recalculo_desfaz_o_save(self):
+        with mock.patch.object(OngQuerySet, "recalcular_contadores", side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                Pet.objects.create(nome="Rex", especie="cachorro", ong=self.ong)
+        self.assertFalse(Pet.objects.exists())
+        self.assertEqual(self._pets(self.ong), (0, 0))
@@ -3,9 +3,12 @@ from django.views.generic import TemplateView, ListView
 from django.shortcuts import render, redirect, get_object_or_404
 from django.db import transaction
 from django.contrib.auth import login, get_user_model
-from django.db.models import Count, Q
+from django.db.models import Q
 from .models import Pet, UsuarioComum, UsuarioEmpresarial, UsuarioOng, ProdutoEmpresa
 from .forms import CadastroForm
+from .paginacao import CursorPaginationMixin
+from . import cache_home, imagens
+from .checkout import CarrinhoVazio, EstoqueInsuficiente, doacoes_por_produto, finalizar_pedido
 
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib import messages
@@ -26,15 +29,15 @@ from django.utils.decorators import method_decorator
 from django.http import HttpResponseBadRequest, HttpResponseForbidden
 from django.http import JsonResponse
 from django.views.decorators.http import require_POST
-from django.db.models import Sum, F, Q
+from django.db.models import Sum, Q
 from django.contrib import messages
 from .models import (
     Carrinho, ItemCarrinho, ProdutoEmpresa,
     Pedido, ItemPedido, UsuarioEmpresarial, UsuarioOng,
-    ProdutoOngVinculo
+    ProdutoOngVinculo, VendaDiaria
 )
 from django.core.paginator import Paginator
-from django.db.models.functions import TruncDate, TruncWeek
+from django.db.models.functions import TruncWeek
 import json
 from django.utils import timezone
 from datetime import timedelta
@@ -53,26 +56,36 @@ class HomeView(TemplateView):
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
 
+        # Cada bloco vem do cache (cache_home), invalidado pelos signals de
+        # Pet / ProdutoEmpresa / UsuarioEmpresarial / UsuarioOng e pelo worker
+        # de imagens; as URLs das miniaturas já vão resolvidas dentro dele.
         # Pets em destaque (mantém compat com 'destaques' antigo)
-        pets = Pet.objects.order_by("-criado_em")[:8]
+        pets = cache_home.obter("pets", lambda: imagens.com_miniaturas(
+            Pet.objects.order_by("-criado_em")[:8], "imagem",
+        ))
         ctx["pets_destaque"] = pets
         ctx["destaques"] = pets  # legado usado em outras páginas
 
         # Produtos / Lojas / ONGs em destaque
-        ctx["produtos_destaque"] = (
+        ctx["produtos_destaque"] = cache_home.obter("produtos", lambda: imagens.com_miniaturas(
             ProdutoEmpresa.objects.filter(ativo=True)
-            .order_by("-criado_em")[:8]
-        )
-        ctx["lojas_destaque"] = (
+            .select_related("empresa__user")
+            .order_by("-criado_em")[:8],
+            "imagem",
+        ))
+        # contadores desnormalizados (índices empresa_ranking_idx / ong_ranking_idx)
+        ctx["lojas_destaque"] = cache_home.obter("lojas", lambda: imagens.com_miniaturas(
             UsuarioEmpresarial.objects
-            .annotate(qtd_produtos_ativos=Count("produtos", filter=Q(produtos__ativo=True)))
-            .order_by("-qtd_produtos_ativos", "razao_social")[:8]
-        )
-        ctx["ongs_destaque"] = (
+            .select_related("user")
+            .order_by("-qtd_produtos_ativos", "razao_social")[:8],
+            "foto",
+        ))
+        ctx["ongs_destaque"] = cache_home.obter("ongs", lambda: imagens.com_miniaturas(
             UsuarioOng.objects
-            .annotate(qtd_pets=Count("pets"))
-            .order_by("-qtd_pets", "nome_fantasia")[:8]
-        )
+            .select_related("user")
+            .order_by("-qtd_pets", "nome_fantasia")[:8],
+            "foto",
+        ))
 
         # Categorias para a faixa de chips
         ctx["categorias_produto"] = [{"slug": k, "nome": v} for k, v in PRODUTO_CATEGORIAS_CHOICES]
@@ -82,11 +95,12 @@ class HomeView(TemplateView):
 
 
 
-class ListarAnimais(ListView):
+class ListarAnimais(CursorPaginationMixin, ListView):
     model = Pet
     template_name = "AmigoFiel/listar.html"
     context_object_name = "pets"
     paginate_by = 24
+    cursor_ordering = ("-criado_em", "id")
 
     def get_queryset(self):
         qs = (Pet.objects
@@ -98,12 +112,19 @@ class ListarAnimais(ListView):
         cidade = self.request.GET.get("cidade", "").strip()
         incluir_adotados = self.request.GET.get("adotados") == "1"
 
-        if q:
+        # por padrão só disponíveis (usa os índices parciais adotado=False)
+        if not incluir_adotados:
+            qs = qs.filter(adotado=False)
+        if especie:
+            qs = qs.filter(especie=especie)
+        if cidade:
             qs = qs.filter(
-                Q(nome__icontains=q) |
-                Q(raca__icontains=q) |
-                Q(descricao__icontains=q)
+                Q(tutor__cidade__icontains=cidade) |
+                Q(ong__cidade__icontains=cidade)
             )
+        if q:
+            # full-text (GIN em search_vector), ordenado por relevância
+            qs = qs.buscar(q)
         return qs
 
     def get_context_data(self, **kwargs):
@@ -112,6 +133,11 @@ class ListarAnimais(ListView):
             "q": self.request.GET.get("q", ""),
             "cidade": self.request.GET.get("cidade", ""),
             "com_produtos": self.request.GET.get("com_produtos", ""),
+            "especie_sel": self.request.GET.get("especie", ""),
+            "adotados": self.request.GET.get("adotados", ""),
+            "ESPECIES": Pet.ESPECIES,
+            # estado das miniaturas da página inteira numa consulta só
+            "pets": imagens.com_miniaturas(ctx["pets"], "imagem"),
         })
         return ctx
 
@@ -151,17 +177,17 @@ def cadastro(request):
         form = CadastroForm()
     return render(request, 'registration/cadastro.html', {'form': form})
 
-class ListarOngs(ListView):
+class ListarOngs(CursorPaginationMixin, ListView):
     model = UsuarioOng
     template_name = "AmigoFiel/ongs.html"
     context_object_name = "ongs"
     paginate_by = 12
+    cursor_ordering = ("nome_fantasia", "id")
 
     def get_queryset(self):
         qs = (
             UsuarioOng.objects
             .select_related("user")
-            .annotate(qtd_pets=Count("pets"))
             .order_by("nome_fantasia")
         )
         q = (self.request.GET.get("q") or "").strip()
@@ -189,24 +215,17 @@ class SobreView(TemplateView):
 class ContatoView(TemplateView):
     template_name = "legal/contato.html"
 
-class ListarLojas(ListView):
+class ListarLojas(CursorPaginationMixin, ListView):
     model = UsuarioEmpresarial
     template_name = "AmigoFiel/lojas.html"
     context_object_name = "lojas"
     paginate_by = 12
+    cursor_ordering = ("-qtd_produtos_ativos", "razao_social", "id")
 
     def get_queryset(self):
         qs = (
             UsuarioEmpresarial.objects
             .select_related("user")
-            .annotate(
-                qtd_produtos_ativos=Count("produtos", filter=Q(produtos__ativo=True)),
-                qtd_produtos_com_ong=Count(
-                    "produtos__vinculos_ong",
-                    filter=Q(produtos__vinculos_ong__ativo=True),
-                    distinct=True
-                )
-            )
             .order_by("-qtd_produtos_ativos", "razao_social")
         )
 
@@ -222,7 +241,7 @@ class ListarLojas(ListView):
         if cidade:
             qs = qs.filter(cidade__icontains=cidade)
         if com_produtos:
-            qs = qs.filter(produtos__ativo=True).distinct()
+            qs = qs.filter(qtd_produtos_ativos__gt=0)
 
         return qs
 
@@ -318,11 +337,12 @@ def perfil_pet(request, handle: str):
 
 # Lista de produtos
 
-class ListarProdutos(ListView):
+class ListarProdutos(CursorPaginationMixin, ListView):
     model = ProdutoEmpresa
     template_name = "AmigoFiel/produtos.html"
     context_object_name = "produtos"
     paginate_by = 12
+    cursor_ordering = ("nome", "id")
 
     def get_queryset(self):
         qs = (ProdutoEmpresa.objects
@@ -339,12 +359,8 @@ class ListarProdutos(ListView):
         incluir_inativos = self.request.GET.get("ativos") == "0"  # se quiser ver inativos
 
         if q:
-            qs = qs.filter(
-                Q(nome__icontains=q) |
-                Q(descricao__icontains=q) |
-                Q(empresa__razao_social__icontains=q) |
-                Q(empresa__user__username__icontains=q)
-            )
+            # documento desnormalizado (produto + empresa): full-text + trigramas
+            qs = qs.buscar(q)
         if cidade:
             qs = qs.filter(empresa__cidade__icontains=cidade)
         if preco_min:
@@ -374,6 +390,8 @@ class ListarProdutos(ListView):
             "preco_max": self.request.GET.get("preco_max", ""),
             "com_estoque": self.request.GET.get("com_estoque", ""),
             "ativos": self.request.GET.get("ativos", "1"),
+            # estado das miniaturas da página inteira numa consulta só
+            "produtos": imagens.com_miniaturas(ctx["produtos"], "imagem"),
         })
         return ctx
 
@@ -493,12 +511,118 @@ def painel_item_detalhe(request, item_id):
     return render(request, 'AmigoFiel/painel/fluxo_venda_detalhe.html', ctx)
 
 
+# --------- Export do fluxo de vendas ---------
+# (cabeçalho, campo em values_list) — sem instanciar modelos nem select_related
+_EXPORT_FLUXO_COLUNAS = [
+    ('pedido_id', 'pedido_id'),
+    ('data_pedido', 'pedido__criado_em'),
+    ('cliente_username', 'pedido__user__username'),
+    ('cliente_email', 'pedido__user__email'),
+    ('produto_id', 'produto_id'),
+    ('produto_nome', 'produto__nome'),
+    ('quantidade', 'quantidade'),
+    ('preco_unitario', 'preco_unitario'),
+    ('total_item', 'total'),
+    ('pedido_total', 'pedido__total_bruto'),
+    ('percentual_doacao', 'percentual_doacao'),
+    ('valor_doacao', 'valor_doacao'),
+    ('retirado', 'retirado'),
+]
+_EXPORT_FLUXO_FORMATOS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+}
+_EXPORT_CHUNK = 2000             # linhas por ida ao cursor do servidor
+_EXPORT_BLOCO = 64 * 1024        # bytes acumulados antes de cada yield
+
+
+class _Eco:
+    """Pseudo-arquivo para csv.writer: devolve a linha em vez de guardá-la."""
+    def write(self, valor):
+        return valor
+
+
+def _linhas_fluxo_csv(linhas):
+    import csv
+    writer = csv.writer(_Eco())
+    yield writer.writerow([c for c, _ in _EXPORT_FLUXO_COLUNAS])
+    for (pedido_id, data, username, email, produto_id, produto_nome, qtd,
+         punit, total, pedido_total, perc, doacao, retirado) in linhas:
+        yield writer.writerow([
+            pedido_id,
+            data.isoformat() if data else '',
+            username or '',
+            email or '',
+            produto_id if produto_id is not None else '',
+            produto_nome or '',
+            qtd,
+            f"{punit:.2f}",
+            f"{total:.2f}",
+            f"{pedido_total}",
+            f"{perc}",
+            f"{doacao}",
+            '1' if retirado else '0',
+        ])
+
+
+def _linhas_fluxo_jsonl(linhas):
+    chaves = [c for c, _ in _EXPORT_FLUXO_COLUNAS]
+    for linha in linhas:
+        registro = dict(zip(chaves, linha))
+        registro['data_pedido'] = registro['data_pedido'].isoformat() if registro['data_pedido'] else None
+        for chave in ('preco_unitario', 'total_item', 'pedido_total', 'percentual_doacao', 'valor_doacao'):
+            registro[chave] = str(registro[chave])  # Decimal como string: sem perder centavos
+        yield json.dumps(registro, ensure_ascii=False) + '\n'
+
+
+def _em_blocos(linhas, compactar):
+    """Agrupa as linhas em blocos de ~64 KiB (e comprime com gzip se pedido)."""
+    import zlib
+    gz = zlib.compressobj(wbits=31) if compactar else None  # 31 = cabeçalho gzip
+    buffer, tamanho = [], 0
+    for linha in linhas:
+        dado = linha.encode('utf-8')
+        buffer.append(dado)
+        tamanho += len(dado)
+        if tamanho >= _EXPORT_BLOCO:
+            bloco = b''.join(buffer)
+            buffer, tamanho = [], 0
+            bloco = gz.compress(bloco) if gz else bloco
+            if bloco:
+                yield bloco
+    bloco = b''.join(buffer)
+    if gz:
+        bloco = gz.compress(bloco) + gz.flush()
+    if bloco:
+        yield bloco
+
+
+def _exportar_fluxo(qs, empresa, formato, compactar):
+    from django.http import StreamingHttpResponse
+
+    content_type, extensao = _EXPORT_FLUXO_FORMATOS[formato]
+    linhas = (
+        qs.values_list(*[campo for _, campo in _EXPORT_FLUXO_COLUNAS])
+        .iterator(chunk_size=_EXPORT_CHUNK)
+    )
+    gerar = _linhas_fluxo_csv if formato == 'csv' else _linhas_fluxo_jsonl
+
+    fname = f"fluxo_vendas_{empresa.user.username}.{extensao}"
+    if compactar:
+        fname += '.gz'
+        content_type = 'application/gzip'
+    resp = StreamingHttpResponse(_em_blocos(gerar(linhas), compactar), content_type=content_type)
+    resp['Content-Disposition'] = f'attachment; filename="{fname}"'
+    return resp
+
+
 @login_required
 def painel_empresa_fluxo(request, handle):
     """Página que mostra o fluxo de produtos vendidos pela empresa (itens de pedidos).
 
     Mostra quem comprou, quando, valor pago e detalhes do item (quantidade, preco unitario, total,
-    doação). Suporta paginação e export CSV via ?export=csv
+    doação). Suporta paginação e export em streaming via ?export=csv ou
+    ?export=jsonl (JSON Lines), com &gzip=1 para baixar compactado.
     """
     empresa = get_object_or_404(UsuarioEmpresarial, user__username=handle)
 
@@ -562,40 +686,10 @@ def painel_empresa_fluxo(request, handle):
         elif retirada_q in {'realizadas', 'sim', 'true', '1'}:
             qs = qs.filter(retirado=True)
 
-    # CSV export
-    if request.GET.get('export') == 'csv':
-        import csv
-        from django.http import HttpResponse
-
-        # include filters in filename for clarity
-        fname = f"fluxo_vendas_{empresa.user.username}.csv"
-        resp = HttpResponse(content_type='text/csv')
-        resp['Content-Disposition'] = f'attachment; filename="{fname}"'
-        writer = csv.writer(resp)
-        writer.writerow([
-            'pedido_id', 'data_pedido', 'cliente_username', 'cliente_email',
-            'produto_id', 'produto_nome', 'quantidade', 'preco_unitario', 'total_item',
-            'pedido_total', 'percentual_doacao', 'valor_doacao', 'retirado'
-        ])
-        for item in qs:
-            pedido = item.pedido
-            cliente = pedido.user
-            writer.writerow([
-                pedido.pk,
-                pedido.criado_em.isoformat() if hasattr(pedido, 'criado_em') else '',
-                getattr(cliente, 'username', ''),
-                getattr(cliente, 'email', ''),
-                item.produto.pk if item.produto else '',
-                item.produto.nome if item.produto else '',
-                item.quantidade,
-                f"{item.preco_unitario:.2f}",
-                f"{item.total:.2f}",
-                f"{getattr(pedido, 'total_bruto', '')}",
-                f"{getattr(item, 'percentual_doacao', '')}",
-                f"{getattr(item, 'valor_doacao', '')}",
-                '1' if getattr(item, 'retirado', False) else '0',
-            ])
-        return resp
+    # Export (streaming): ?export=csv | ?export=jsonl, opcionalmente &gzip=1
+    formato = request.GET.get('export')
+    if formato in _EXPORT_FLUXO_FORMATOS:
+        return _exportar_fluxo(qs, empresa, formato, request.GET.get('gzip') == '1')
 
     # agregados (soma dos itens filtrados)
     aggr = qs.aggregate(total_items=Sum('total'), total_doacao=Sum('valor_doacao'))
@@ -755,14 +849,6 @@ def _get_or_create_cart(user):
     cart, _ = Carrinho.objects.get_or_create(user=user, ativo=True)
     return cart
 
-def _produto_doacao_info(produto: ProdutoEmpresa):
-    # tenta achar vinculo direto; se não houver, nenhum % (poderia herdar Parceria se quiser evoluir)
-    vinc = produto.vinculos_ong.filter(ativo=True).order_by("-percentual").first()
-    if vinc:
-        return vinc.ong, vinc.percentual
-    return None, Decimal("0.00")
-
-
 # --------- Carrinho ----------
 @login_required
 def carrinho_adicionar(request, produto_id):
@@ -816,10 +902,11 @@ def carrinho_remover(request, item_id):
 @login_required
 def carrinho_detalhe(request):
     cart = _get_or_create_cart(request.user)
-    itens = (cart.itens
-             .select_related("produto", "produto__empresa")
-             .prefetch_related("produto__vinculos_ong__ong")
-             .order_by("produto__empresa__razao_social", "produto__nome"))
+    itens = list(cart.itens
+                 .select_related("produto", "produto__empresa")
+                 .prefetch_related("produto__vinculos_ong__ong")
+                 .order_by("produto__empresa__razao_social", "produto__nome"))
+    doacoes = doacoes_por_produto([it.produto for it in itens])
 
     # agrupa por loja para exibir em seções (lista de tuplas para facilitar no template)
     grupos_dict = {}
@@ -845,7 +932,7 @@ def carrinho_detalhe(request):
         economia_total = valor_desconto_unit * it.quantidade
         
         # Informações de doação para ONG
-        ong, perc_doacao = _produto_doacao_info(prod)
+        ong, perc_doacao = doacoes[prod.pk]
         valor_doacao = (subtotal_com_desconto * (perc_doacao or Decimal("0.00"))) / Decimal("100")
         
         # Adicionar ao item (para usar no template)
@@ -880,32 +967,16 @@ def carrinho_detalhe(request):
 @login_required
 def checkout_simulado(request):
     cart = _get_or_create_cart(request.user)
-    itens = cart.itens.select_related("produto", "produto__empresa")
-    if not itens.exists():
+    try:
+        finalizar_pedido(request.user, cart)
+    except CarrinhoVazio:
         messages.error(request, "Seu carrinho está vazio.")
         return redirect("amigofiel:carrinho-ver")
+    except EstoqueInsuficiente as e:
+        nomes = ", ".join(p.nome for p in e.produtos)
+        messages.error(request, f"Estoque insuficiente para: {nomes}.")
+        return redirect("amigofiel:carrinho-ver")
 
-    pedido = Pedido.objects.create(user=request.user, status="pago")
-    for it in itens:
-        ong, perc = _produto_doacao_info(it.produto)
-        punit = it.produto.preco or Decimal("0.00")
-        total = punit * it.quantidade
-        valor_doacao = (total * (perc or Decimal("0.00"))) / Decimal("100")
-
-        ItemPedido.objects.create(
-            pedido=pedido,
-            produto=it.produto,
-            empresa=it.produto.empresa,
-            ong=ong,
-            quantidade=it.quantidade,
-            preco_unitario=punit,
-            total=total,
-            percentual_doacao=perc or Decimal("0.00"),
-            valor_doacao=valor_doacao,
-        )
-
-    pedido.recalcular_totais()
-    cart.itens.all().delete()  # limpa carrinho
     messages.success(request, "Pedido criado")
     return redirect("amigofiel:carrinho-ver")
 
@@ -940,10 +1011,7 @@ def checkout_simulado(request):
 def painel_empresa(request, handle: str):
     # Empresa dona do painel
     empresa = get_object_or_404(
-        UsuarioEmpresarial.objects.select_related("user").annotate(
-            total_produtos=Count("produtos"),
-            ativos=Count("produtos", filter=Q(produtos__ativo=True)),
-        ),
+        UsuarioEmpresarial.objects.select_related("user"),
         user__username=handle
     )
 
@@ -956,12 +1024,13 @@ def painel_empresa(request, handle: str):
     total_doacao = None
     itens_vendidos = 0
     try:
-        from .models import ItemPedido
-        vendas = ItemPedido.objects.filter(empresa=empresa)
-        agg = vendas.aggregate(total_vendas=Sum("total"), total_doacao=Sum("valor_doacao"))
+        # rollup diário (VendaDiaria): poucas linhas por dia em vez de todos os itens
+        agg = VendaDiaria.objects.filter(empresa=empresa).aggregate(
+            total_vendas=Sum("receita"), total_doacao=Sum("doacao"), itens=Sum("itens")
+        )
         total_vendas = agg["total_vendas"] or 0
         total_doacao = agg["total_doacao"] or 0
-        itens_vendidos = vendas.count()
+        itens_vendidos = agg["itens"] or 0
     except Exception:
         pass  # modelos ainda não migrados? ok, mostra só produtos
 
@@ -998,8 +1067,8 @@ def painel_empresa(request, handle: str):
         "total_ongs": len(ongs_parceiras),
         "total_vinculos": vinculos.count(),
         "met": {
-            "total_produtos": empresa.total_produtos,
-            "ativos": empresa.ativos,
+            "total_produtos": empresa.qtd_produtos,
+            "ativos": empresa.qtd_produtos_ativos,
             "itens_vendidos": itens_vendidos,
             "total_vendas": total_vendas,
             "total_doacao": total_doacao,
@@ -1007,15 +1076,13 @@ def painel_empresa(request, handle: str):
     }
     # Série temporal: vendas por dia (últimos 30 dias)
     try:
-        from .models import ItemPedido
-        end_date = timezone.now().date()
+        end_date = timezone.localdate()
         start_date = end_date - timedelta(days=29)
         qs_days = (
-            ItemPedido.objects
-            .filter(empresa=empresa, criado_em__date__gte=start_date)
-            .annotate(dia=TruncDate('criado_em'))
+            VendaDiaria.objects
+            .filter(empresa=empresa, dia__gte=start_date)
             .values('dia')
-            .annotate(total=Sum('total'), pedidos=Count('id'))
+            .annotate(total=Sum('receita'), pedidos=Sum('itens'))
             .order_by('dia')
         )
         totals_map = {item['dia'].isoformat(): float(item['total'] or 0) for item in qs_days}
@@ -1070,14 +1137,13 @@ def painel_empresa_detalhado(request, handle: str):
     total_sold = 0
     total_doacao = 0.0
     try:
-        from .models import ItemPedido
         # Agregar por produto: quantidade vendida, receita e doação (apenas para produtos no queryset)
-        product_ids = list(produtos_qs.values_list('id', flat=True))
         vendas_prod = (
-            ItemPedido.objects
-            .filter(empresa=empresa, produto_id__in=product_ids)
+            VendaDiaria.objects
+            .filter(empresa=empresa, produto__in=produtos_qs.values('id'))
             .values('produto')
-            .annotate(qtd_vendida=Sum('quantidade'), receita=Sum('total'), doacao=Sum('valor_doacao'))
+            .annotate(qtd_vendida=Sum('quantidade'), receita=Sum('receita'), doacao=Sum('doacao'))
+            .order_by()
         )
         vendas_map = {v['produto']: v for v in vendas_prod}
 
@@ -1189,20 +1255,19 @@ def painel_empresa_detalhado(request, handle: str):
     }
     # Série temporal: receita por semana (últimas 12 semanas)
     try:
-        from .models import ItemPedido
         weeks = 12
-        end_date = timezone.now().date()
+        end_date = timezone.localdate()
         start_date = end_date - timedelta(days=7 * (weeks - 1))
 
         # Align start_date to the beginning of the week (Monday) to match TruncWeek behaviour
         start_week = start_date - timedelta(days=start_date.weekday())
 
         qs_weeks = (
-            ItemPedido.objects
-            .filter(empresa=empresa, criado_em__date__gte=start_date)
-            .annotate(semana=TruncWeek('criado_em'))
+            VendaDiaria.objects
+            .filter(empresa=empresa, dia__gte=start_date)
+            .annotate(semana=TruncWeek('dia'))
             .values('semana')
-            .annotate(total=Sum('total'))
+            .annotate(total=Sum('receita'))
             .order_by('semana')
         )
 
@@ -1234,7 +1299,7 @@ def painel_empresa_detalhado(request, handle: str):
 @login_required
 def painel_ong(request, handle: str):
     ong = get_object_or_404(
-        UsuarioOng.objects.select_related("user").annotate(qtd_pets=Count("pets")),
+        UsuarioOng.objects.select_related("user"),
         user__username=handle
     )
 
@@ -1245,13 +1310,13 @@ def painel_ong(request, handle: str):
     produtos_vinc = []
     total_doado = None
     try:
-        from .models import ProdutoOngVinculo, ItemPedido
+        from .models import ProdutoOngVinculo
         produtos_vinc = (
             ProdutoOngVinculo.objects
             .select_related("produto", "produto__empresa", "produto__empresa__user")
             .filter(ong=ong, ativo=True)
         )
-        total_doado = ItemPedido.objects.filter(ong=ong).aggregate(s=Sum("valor_doacao"))["s"] or 0
+        total_doado = VendaDiaria.objects.filter(ong=ong).aggregate(s=Sum("doacao"))["s"] or 0
     except Exception:
         pass
     
@@ -1280,19 +1345,18 @@ def painel_ong(request, handle: str):
         "total_produtos_vinculados": produtos_vinc.count(),
         "pets": pets,
         "qtd_pets": ong.qtd_pets,
+        "qtd_pets_disponiveis": ong.qtd_pets_disponiveis,
         "total_doado": total_doado,
     }
     # Série temporal: doações / vendas vinculadas à ONG (últimos 30 dias)
     try:
-        from .models import ItemPedido
-        end_date = timezone.now().date()
+        end_date = timezone.localdate()
         start_date = end_date - timedelta(days=29)
         qs_days = (
-            ItemPedido.objects
-            .filter(ong=ong, criado_em__date__gte=start_date)
-            .annotate(dia=TruncDate('criado_em'))
+            VendaDiaria.objects
+            .filter(ong=ong, dia__gte=start_date)
             .values('dia')
-            .annotate(total_doado=Sum('valor_doacao'), pedidos=Count('id'))
+            .annotate(total_doado=Sum('doacao'), pedidos=Sum('itens'))
             .order_by('dia')
         )
         totals_map = {item['dia'].isoformat(): float(item['total_doado'] or 0) for item in qs_days}
@@ -1339,27 +1403,30 @@ def produto_editar(request, empresa_handle, produto_slug):
     if request.method == "POST":
         form = ProdutoForm(request.POST, request.FILES, instance=produto)
         if form.is_valid():
-            produto = form.save()
-            
             # Processar vínculo com ONG
             ong = form.cleaned_data.get("ong_vinculo")
             percentual = form.cleaned_data.get("percentual_doacao")
             vinculo_ativo = form.cleaned_data.get("vinculo_ativo", True)
-            
-            # Desativar vínculos antigos
-            produto.vinculos_ong.update(ativo=False)
-            
-            # Criar/atualizar vínculo se houver ONG e percentual
-            if ong and percentual and percentual > 0:
-                from .models import ProdutoOngVinculo
-                ProdutoOngVinculo.objects.update_or_create(
-                    produto=produto,
-                    ong=ong,
-                    defaults={
-                        "percentual": percentual,
-                        "ativo": vinculo_ativo,
-                    }
-                )
+
+            # produto, vínculos e contadores da empresa mudam juntos
+            with transaction.atomic():
+                produto = form.save()
+
+                # Desativar vínculos antigos (update() não dispara signals: atualiza os contadores aqui)
+                produto.vinculos_ong.update(ativo=False)
+                UsuarioEmpresarial.objects.filter(pk=produto.empresa_id).recalcular_contadores()
+
+                # Criar/atualizar vínculo se houver ONG e percentual
+                if ong and percentual and percentual > 0:
+                    from .models import ProdutoOngVinculo
+                    ProdutoOngVinculo.objects.update_or_create(
+                        produto=produto,
+                        ong=ong,
+                        defaults={
+                            "percentual": percentual,
+                            "ativo": vinculo_ativo,
+                        }
+                    )
             
             messages.success(request, f"Produto '{produto.nome}' atualizado com sucesso!")
             return redirect(produto.get_absolute_url())
@@ -0,0 +1,8 @@
+# chat/context_processors.py
+from . import unread
+
+
+def chat_nao_lidas(request):
+    user = request.user
+    # callable: o template só consulta o cache se de fato usar o valor
+    return {"chat_nao_lidas": lambda: unread.total(user)}
@@ -0,0 +1,63 @@
+# chat/management/commands/arquivar_mensagens.py
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from chat.models import ArchivedMessage, Message
+
+COLUNAS = "id, conversation_id, sender_id, text, created_at"
+
+
+class Command(BaseCommand):
+    help = (
+        "Move mensagens do chat mais antigas que o horizonte (CHAT_ARQUIVO_DIAS) "
+        "para a tabela de arquivo, em lotes. O histórico continua visível nas "
+        "conversas; a tabela quente fica pequena."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dias", type=int, default=settings.CHAT_ARQUIVO_DIAS,
+                            help="Arquiva mensagens com mais de N dias (padrão: CHAT_ARQUIVO_DIAS).")
+        parser.add_argument("--lote", type=int, default=5000, help="Mensagens movidas por transação.")
+        parser.add_argument("--dry-run", action="store_true", help="Só conta o que seria arquivado.")
+
+    def handle(self, *args, dias, lote, dry_run, **options):
+        limite = timezone.now() - timedelta(days=dias)
+        if dry_run:
+            n = Message.objects.filter(created_at__lt=limite).count()
+            self.stdout.write(f"{n} mensagem(ns) anteriores a {limite:%d/%m/%Y} seriam arquivadas.")
+            return
+
+        # DELETE ... RETURNING alimentando o INSERT: cada lote é um único
+        # comando atômico; SKIP LOCKED não disputa linhas com quem está usando
+        msg = Message._meta.db_table
+        arq = ArchivedMessage._meta.db_table
+        sql = f"""
+            WITH movidas AS (
+                DELETE FROM {msg}
+                WHERE id IN (
+                    SELECT id FROM {msg}
+                    WHERE created_at < %s
+                    ORDER BY id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING {COLUNAS}
+            )
+            INSERT INTO {arq} ({COLUNAS})
+            SELECT {COLUNAS} FROM movidas
+        """
+        total = 0
+        while True:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(sql, [limite, lote])
+                movidas = cursor.rowcount
+            total += movidas
+            if movidas < lote:
+                break
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} mensagem(ns) anteriores a {limite:%d/%m/%Y} arquivada(s)."
+        ))
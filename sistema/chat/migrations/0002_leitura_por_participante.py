@@ -0,0 +1,50 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:38
+
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_leitura(apps, schema_editor):
+    # deriva cursor e contador do read_at que existia por mensagem
+    Conversation = apps.get_model('chat', 'Conversation')
+    Message = apps.get_model('chat', 'Message')
+    for lado, outro in (('a', 'user_b'), ('b', 'user_a')):
+        do_outro = Message.objects.filter(conversation=OuterRef('pk'), sender=OuterRef(outro)).order_by()
+        nao_lidas = do_outro.filter(read_at__isnull=True).values('conversation').annotate(c=Count('pk')).values('c')[:1]
+        ultima_lida = do_outro.filter(read_at__isnull=False).values('conversation').annotate(m=Max('pk')).values('m')[:1]
+        Conversation.objects.update(**{
+            f'{lado}_unread': Coalesce(Subquery(nao_lidas), 0),
+            f'{lado}_last_read_id': Subquery(ultima_lida),
+        })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='a_last_read_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='a_unread',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='b_last_read_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='b_unread',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_leitura, migrations.RunPython.noop),
+    ]
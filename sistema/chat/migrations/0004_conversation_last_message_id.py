@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:41
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_last_message_id(apps, schema_editor):
+    Conversation = apps.get_model('chat', 'Conversation')
+    Message = apps.get_model('chat', 'Message')
+    ultima = Message.objects.filter(conversation=OuterRef('pk')).order_by('-id').values('id')[:1]
+    Conversation.objects.update(last_message_id=Subquery(ultima))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_message_conv_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_last_message_id, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:05
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0005_archivedmessage'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='message',
+            name='read_at',
+        ),
+    ]
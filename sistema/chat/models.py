@@ -1,10 +1,72 @@
 from django.conf import settings
-from django.db import models
-from django.db.models import Q
-from django.utils import timezone
+from django.db import models, transaction
+from django.db.models import Case, CharField, Count, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest
+
+from . import unread
 
 User = settings.AUTH_USER_MODEL
 
+
+class ConversationQuerySet(models.QuerySet):
+    def do_usuario(self, user):
+        return self.filter(Q(user_a=user) | Q(user_b=user))
+
+    def com_resumo(self, user):
+        """
+        Anota, numa única query, o que a inbox precisa de cada conversa:
+        última mensagem (texto, data, remetente), não lidas por `user` (do
+        contador da conversa) e os dados de exibição do outro participante
+        (perfil empresa/ONG/comum) usados nos filtros de tipo/busca. Avatar e
+        cidade vêm dos cartões em cache (AmigoFiel.cartoes).
+        """
+        def do_outro(campo):
+            # o "outro" é user_b quando eu sou user_a, e vice-versa
+            return Case(
+                When(user_a_id=user.pk, then=F(f"user_b__{campo}")),
+                default=F(f"user_a__{campo}"),
+            )
+
+        ultima = (Message.objects
+                  .filter(conversation=OuterRef("pk"))
+                  .order_by("-created_at", "-id"))
+        # conversa cujo histórico foi todo arquivado: prévia vem do arquivo
+        ultima_arq = (ArchivedMessage.objects
+                      .filter(conversation=OuterRef("pk"))
+                      .order_by("-created_at", "-id"))
+        return self.annotate(
+            last_text=Coalesce(Subquery(ultima.values("text")[:1]),
+                               Subquery(ultima_arq.values("text")[:1])),
+            last_created_at=Coalesce(Subquery(ultima.values("created_at")[:1]),
+                                     Subquery(ultima_arq.values("created_at")[:1])),
+            last_sender_username=Coalesce(Subquery(ultima.values("sender__username")[:1]),
+                                          Subquery(ultima_arq.values("sender__username")[:1])),
+            unread_count=Case(
+                When(user_a_id=user.pk, then=F("a_unread")),
+                default=F("b_unread"),
+            ),
+            other_id=do_outro("id"),
+            other_username=do_outro("username"),
+            other_empresa_id=do_outro("perfil_empresa__id"),
+            other_empresa_nome=do_outro("perfil_empresa__razao_social"),
+            other_ong_id=do_outro("perfil_ong__id"),
+            other_ong_nome=do_outro("perfil_ong__nome_fantasia"),
+        ).annotate(
+            # mesma prioridade de get_user_display_info: empresa > ong > comum
+            other_type=Case(
+                When(other_empresa_id__isnull=False, then=Value("empresa")),
+                When(other_ong_id__isnull=False, then=Value("ong")),
+                default=Value("comum"),
+                output_field=CharField(),
+            ),
+            other_name=Case(
+                When(other_empresa_id__isnull=False, then=F("other_empresa_nome")),
+                When(other_ong_id__isnull=False, then=F("other_ong_nome")),
+                default=F("other_username"),
+                output_field=CharField(),
+            ),
+        )
+
 class Conversation(models.Model):
     # Normalizamos a dupla: user_a.id < user_b.id para evitar duplicatas
     user_a = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversations_as_a')
@@ -13,6 +75,18 @@ class Conversation(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     last_message_at = models.DateTimeField(db_index=True, null=True, blank=True)
 
+    # Estado de leitura de cada lado: id da última mensagem lida (cursor) e
+    # quantas mensagens do outro ainda não foram lidas. Mantidos por
+    # register_message() (envio) e mark_read_by() (abertura da conversa).
+    a_last_read_id = models.BigIntegerField(null=True, blank=True)
+    b_last_read_id = models.BigIntegerField(null=True, blank=True)
+    a_unread = models.PositiveIntegerField(default=0)
+    b_unread = models.PositiveIntegerField(default=0)
+    # id da mensagem mais recente: "versão" da conversa (ETag/304 do polling)
+    last_message_id = models.BigIntegerField(null=True, blank=True)
+
+    objects = ConversationQuerySet.as_manager()
+
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=['user_a', 'user_b'], name='unique_conv_pair'),
@@ -33,10 +107,92 @@ class Conversation(models.Model):
     def other_of(self, user):
         return self.user_b if user == self.user_a else self.user_a
 
+    def side_of(self, user):
+        return 'a' if user.pk == self.user_a_id else 'b'
+
+    def unread_for(self, user):
+        return getattr(self, f'{self.side_of(user)}_unread')
+
+    def last_read_id_for(self, user):
+        return getattr(self, f'{self.side_of(user)}_last_read_id')
+
+    def register_message(self, msg):
+        """Nova mensagem: +1 não lida para o destinatário e bump de last_message_at/id (um UPDATE)."""
+        other = 'b' if self.side_of(msg.sender) == 'a' else 'a'
+        Conversation.objects.filter(pk=self.pk).update(**{
+            f'{other}_unread': F(f'{other}_unread') + 1,
+            'last_message_at': msg.created_at,
+            # Greatest: dois envios simultâneos não fazem a versão andar para trás
+            'last_message_id': Greatest(Coalesce(F('last_message_id'), 0), msg.id),
+        })
+        setattr(self, f'{other}_unread', getattr(self, f'{other}_unread') + 1)
+        destinatario = getattr(self, f'user_{other}_id')
+        # robust: cache fora do ar não pode virar 500 depois da mensagem gravada
+        # (o cliente reenviaria); o badge se corrige quando a chave expira
+        transaction.on_commit(lambda: unread.incrementar(destinatario), robust=True)
+        self.last_message_at = msg.created_at
+        self.last_message_id = max(self.last_message_id or 0, msg.id)
+
+    def send(self, sender, text):
+        """Grava a mensagem e atualiza a conversa (contador, last_message_*) na mesma transação."""
+        with transaction.atomic():
+            msg = Message.objects.create(conversation=self, sender=sender, text=text)
+            self.register_message(msg)
+        return msg
+
+    @property
+    def etag(self):
+        return f'W/"{self.pk}-{self.last_message_id or 0}"'
+
+    def mark_read_by(self, user, upto_id):
+        """
+        Avança o cursor de leitura de `user` até a mensagem `upto_id` (a última
+        que ele viu). Não lidas passam a ser só as do outro depois do cursor —
+        se algo chegou nesse meio tempo, continua contando. Toca uma linha só;
+        não escreve nada se o cursor já estiver lá ou se não houver não lidas.
+        """
+        side = self.side_of(user)
+        cursor = getattr(self, f'{side}_last_read_id')
+        if upto_id is None or (cursor is not None and upto_id <= cursor):
+            return False
+        if not getattr(self, f'{side}_unread'):
+            # nada pendente: o cursor só serve para evitar escrita, não precisa avançar
+            return False
+        restantes = (Message.objects
+                     .filter(conversation=OuterRef('pk'), id__gt=upto_id)
+                     .exclude(sender_id=user.pk)
+                     .order_by()
+                     .values('conversation')
+                     .annotate(c=Count('pk'))
+                     .values('c')[:1])
+        Conversation.objects.filter(pk=self.pk).update(**{
+            f'{side}_last_read_id': upto_id,
+            f'{side}_unread': Coalesce(Subquery(restantes), 0),
+        })
+        setattr(self, f'{side}_unread', 0)  # o que chegou depois aparece no próximo poll
+        transaction.on_commit(lambda: unread.invalidar(user.pk), robust=True)
+        setattr(self, f'{side}_last_read_id', upto_id)
+        return True
+
+    @staticmethod
+    def find(u1, u2):
+        """Só leitura: a conversa da dupla ou None (GET/polling nunca criam linha)."""
+        a, b = sorted((u1.id, u2.id))
+        return Conversation.objects.filter(user_a_id=a, user_b_id=b).first()
+
     @staticmethod
     def for_users(u1, u2):
-        a, b = (u1, u2) if u1.id < u2.id else (u2, u1)
-        return Conversation.objects.get_or_create(user_a=a, user_b=b)[0]
+        """
+        Conversa da dupla, criando na primeira mensagem. O INSERT usa
+        ON CONFLICT DO NOTHING: se outro request criar ao mesmo tempo, não
+        estoura unique_conv_pair — só relemos a linha que ganhou.
+        """
+        conv = Conversation.find(u1, u2)
+        if conv is None:
+            a, b = sorted((u1.id, u2.id))
+            Conversation.objects.bulk_create([Conversation(user_a_id=a, user_b_id=b)], ignore_conflicts=True)
+            conv = Conversation.objects.get(user_a_id=a, user_b_id=b)
+        return conv
 
 
 class Message(models.Model):
@@ -44,12 +200,60 @@ class Message(models.Model):
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='messages_sent')
     text = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
-    read_at = models.DateTimeField(null=True, blank=True, db_index=True)
 
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # janela "últimas N" e "carregar anteriores" (keyset) por conversa
+            models.Index(fields=['conversation', 'created_at', 'id'], name='msg_conv_created_id_idx'),
+        ]
+
+
+class ArchivedMessage(models.Model):
+    """
+    Mensagens antigas movidas de Message por ``manage.py arquivar_mensagens``.
+    Mantém o id original e só o necessário para exibir o histórico (o
+    estado de leitura vive nos cursores da Conversation), para a
+    tabela quente e seus índices continuarem pequenos.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='archived_messages')
+    sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    text = models.TextField()
+    created_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['conversation', 'created_at', 'id'], name='msgarq_conv_created_id_idx'),
+        ]
+
+
+def _antes_de(ref):
+    return Q(created_at__lt=ref['created_at']) | Q(created_at=ref['created_at'], id__lt=ref['id'])
+
+
+def history(conv, limit, before_id=None):
+    """
+    Até `limit` mensagens da conversa, da mais recente para a mais antiga,
+    anteriores à mensagem `before_id` (ou as últimas). Lê a tabela quente e,
+    se faltar, completa com o arquivo — quem chama não precisa saber onde
+    cada mensagem está. Retorna (mensagens, has_more).
+    """
+    filtro = Q()
+    if before_id is not None:
+        ref = (conv.messages.filter(pk=before_id).values('created_at', 'id').first()
+               or conv.archived_messages.filter(pk=before_id).values('created_at', 'id').first())
+        if ref is None:
+            return [], False
+        filtro = _antes_de(ref)
 
-    def mark_read(self):
-        if not self.read_at:
-            self.read_at = timezone.now()
-            self.save(update_fields=['read_at'])
+    ordem = ('-created_at', '-id')
+    msgs = list(conv.messages.select_related('sender').filter(filtro).order_by(*ordem)[:limit + 1])
+    if len(msgs) <= limit:
+        # tudo o que está no arquivo é mais antigo que a tabela quente
+        if msgs:
+            filtro = _antes_de({'created_at': msgs[-1].created_at, 'id': msgs[-1].id})
+        msgs += list(conv.archived_messages.select_related('sender')
+                     .filter(filtro).order_by(*ordem)[:limit + 1 - len(msgs)])
+    return msgs[:limit], len(msgs) > limit
@@ -0,0 +1,127 @@
+"""
+Pub/sub para a entrega do chat em tempo real (SSE sobre ASGI).
+
+As views publicam (código síncrono, qualquer thread) e o stream SSE de cada
+aba aberta assina o canal da dupla de usuários. O backend é escolhido por
+``settings.CHAT_PUBSUB_BACKEND``:
+
+- ``chat.pubsub.MemoryBroker`` (padrão): filas asyncio no próprio processo.
+  Suficiente para um worker ASGI só.
+- ``chat.pubsub.RedisBroker``: PUBLISH/SUBSCRIBE do Redis (``REDIS_URL``),
+  para vários workers/máquinas. Requer o pacote ``redis``.
+
+Um backend é qualquer objeto com ``publish(canal, payload)`` e
+``assinar(canal)`` (context manager assíncrono que entrega um objeto com
+``await receber(timeout)`` -> payload ou None).
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+def canal_da_conversa(user_id_1, user_id_2):
+    """Canal por dupla (não por Conversation): funciona antes da conversa existir."""
+    a, b = sorted((user_id_1, user_id_2))
+    return f"chat:{a}:{b}"
+
+
+class _AssinaturaMemoria:
+    def __init__(self, fila):
+        self.fila = fila
+
+    async def receber(self, timeout):
+        try:
+            return await asyncio.wait_for(self.fila.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+def _entregar(fila, payload):
+    try:
+        fila.put_nowait(payload)
+    except asyncio.QueueFull:
+        pass  # cliente lento: ele recupera pelo polling (api_thread_since)
+
+
+class MemoryBroker:
+    FILA_MAX = 100
+
+    def __init__(self):
+        self._assinantes = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, canal, payload):
+        with self._lock:
+            alvos = list(self._assinantes.get(canal, ()))
+        for loop, fila in alvos:
+            loop.call_soon_threadsafe(_entregar, fila, payload)
+
+    @asynccontextmanager
+    async def assinar(self, canal):
+        item = (asyncio.get_running_loop(), asyncio.Queue(maxsize=self.FILA_MAX))
+        with self._lock:
+            self._assinantes[canal].add(item)
+        try:
+            yield _AssinaturaMemoria(item[1])
+        finally:
+            with self._lock:
+                self._assinantes[canal].discard(item)
+                if not self._assinantes[canal]:
+                    del self._assinantes[canal]
+
+
+class _AssinaturaRedis:
+    def __init__(self, pubsub):
+        self.pubsub = pubsub
+
+    async def receber(self, timeout):
+        msg = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+        return json.loads(msg["data"]) if msg else None
+
+
+class RedisBroker:
+    def __init__(self, url=None):
+        self.url = url or settings.REDIS_URL
+        self._cliente = None
+
+    def publish(self, canal, payload):
+        if self._cliente is None:
+            import redis
+            self._cliente = redis.Redis.from_url(self.url)
+        self._cliente.publish(canal, json.dumps(payload))
+
+    @asynccontextmanager
+    async def assinar(self, canal):
+        import redis.asyncio as aioredis
+        cliente = aioredis.Redis.from_url(self.url)
+        pubsub = cliente.pubsub()
+        await pubsub.subscribe(canal)
+        try:
+            yield _AssinaturaRedis(pubsub)
+        finally:
+            await pubsub.unsubscribe(canal)
+            await pubsub.aclose()
+            await cliente.aclose()
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(settings.CHAT_PUBSUB_BACKEND)()
+
+
+def publicar_mensagem(msg):
+    """Publica uma Message recém-criada no canal da dupla (chamar após o commit)."""
+    conv = msg.conversation
+    get_broker().publish(canal_da_conversa(conv.user_a_id, conv.user_b_id), {
+        'id': msg.id,
+        'conversation': conv.pk,
+        'sender': msg.sender.username,
+        'text': msg.text,
+        'created_at': msg.created_at.isoformat(),
+    })
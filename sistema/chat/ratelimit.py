@@ -0,0 +1,52 @@
+"""
+Limite de envio de mensagens por usuário (janela deslizante no cache).
+
+Cada usuário pode enviar até CHAT_RATE_CAPACIDADE mensagens numa janela de
+CHAT_RATE_CAPACIDADE / CHAT_RATE_POR_SEGUNDO segundos: rajadas curtas
+passam, spam contínuo fica limitado a CHAT_RATE_POR_SEGUNDO e é barrado
+antes de chegar ao banco.
+
+A contagem usa um contador por janela fixa (``cache.add`` + ``cache.incr``)
+e pondera a janela anterior pelo quanto ela ainda cobre da janela deslizante.
+Cada requisição recebe do ``incr`` um número só dela, então uma rajada
+paralela não passa do limite. Isso vale com Redis (REDIS_URL) ou LocMem;
+o FileBasedCache implementa ``incr`` como leitura + escrita.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+def _chave(user_id, janela):
+    return f"chat:envios:{user_id}:{janela}"
+
+
+def consumir(user_id):
+    """Conta um envio. Retorna (permitido, segundos_para_tentar_de_novo)."""
+    capacidade = settings.CHAT_RATE_CAPACIDADE
+    duracao = capacidade / settings.CHAT_RATE_POR_SEGUNDO
+    agora = time.time()
+    janela, decorrido = divmod(agora, duracao)
+    janela = int(janela)
+
+    atual = _chave(user_id, janela)
+    # duas janelas de vida: a seguinte ainda lê esta como "anterior"
+    cache.add(atual, 0, timeout=int(2 * duracao) + 1)
+    try:
+        n = cache.incr(atual)
+    except ValueError:  # expirou entre o add e o incr
+        cache.add(atual, 1, timeout=int(2 * duracao) + 1)
+        n = 1
+    anterior = cache.get(_chave(user_id, janela - 1), 0)
+
+    cobertura = 1 - decorrido / duracao  # fração da janela anterior ainda dentro da deslizante
+    if anterior * cobertura + n <= capacidade:
+        return True, 0
+
+    # recusado não conta: devolve a ficha
+    cache.decr(atual)
+    if n > capacidade or not anterior:
+        return False, duracao - decorrido
+    # espera a janela anterior "sair" o bastante para caber mais um
+    return False, max(duracao * (1 - (capacidade - n) / anterior) - decorrido, 0)
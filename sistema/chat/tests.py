@@ -1,3 +1,187 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import ratelimit, unread
+from .models import ArchivedMessage, Conversation, Message, history
+
+CACHE_LOCAL = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'chat-tests'}}
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class ConversaLeituraTests(TestCase):
+    """Cursor de leitura, contador de não lidas por lado e badge em cache."""
+
+    def setUp(self):
+        cache.clear()
+        self.ana = User.objects.create_user('ana')
+        self.bia = User.objects.create_user('bia')
+        self.conv = Conversation.for_users(self.ana, self.bia)
+
+    def test_find_so_le_e_for_users_cria_uma_vez(self):
+        carla = User.objects.create_user('carla')
+        self.assertIsNone(Conversation.find(self.ana, carla))
+        self.assertEqual(Conversation.objects.count(), 1)
+        self.assertEqual(Conversation.for_users(self.bia, self.ana).pk, self.conv.pk)
+        self.assertEqual(Conversation.find(self.bia, self.ana).pk, self.conv.pk)
+        self.assertEqual(Conversation.objects.count(), 1)
+
+    def test_nao_lidas_e_cursor(self):
+        m1 = self.conv.send(self.ana, 'oi')
+        m2 = self.conv.send(self.ana, 'tudo bem?')
+        self.conv.refresh_from_db()
+        self.assertEqual((self.conv.unread_for(self.bia), self.conv.unread_for(self.ana)), (2, 0))
+        self.assertEqual(self.conv.last_message_id, m2.id)
+
+        self.assertTrue(self.conv.mark_read_by(self.bia, m1.id))
+        self.conv.refresh_from_db()
+        self.assertEqual(self.conv.unread_for(self.bia), 1)
+        self.assertEqual(self.conv.last_read_id_for(self.bia), m1.id)
+        # cursor não volta nem reescreve
+        self.assertFalse(self.conv.mark_read_by(self.bia, m1.id))
+
+        m3 = self.conv.send(self.bia, 'tudo!')
+        self.conv.refresh_from_db()
+        self.assertEqual((self.conv.unread_for(self.bia), self.conv.unread_for(self.ana)), (1, 1))
+
+        # ler até a própria mensagem cobre as do outro que vieram antes
+        self.assertTrue(self.conv.mark_read_by(self.bia, m3.id))
+        self.conv.refresh_from_db()
+        self.assertEqual((self.conv.unread_for(self.bia), self.conv.unread_for(self.ana)), (0, 1))
+
+    def test_badge_incrementa_no_envio_e_recalcula_na_leitura(self):
+        self.assertEqual(unread.total(self.bia), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            msg = self.conv.send(self.ana, 'oi')
+        with self.assertNumQueries(0):
+            self.assertEqual(unread.total(self.bia), 1)
+
+        self.conv.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.conv.mark_read_by(self.bia, msg.id)
+        self.assertEqual(unread.total(self.bia), 0)
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class PollingTests(TestCase):
+    """api_thread_since: ETag da conversa e 304 só para requisição condicional."""
+
+    def setUp(self):
+        cache.clear()
+        self.ana = User.objects.create_user('ana')
+        self.bia = User.objects.create_user('bia')
+        self.conv = Conversation.for_users(self.ana, self.bia)
+        self.ultima = self.conv.send(self.ana, 'oi')
+        self.client.force_login(self.bia)
+        self.url = reverse('chat:api-thread-since', kwargs={'username': 'ana'})
+
+    def test_entrega_as_novas_e_avanca_o_cursor(self):
+        r = self.client.get(self.url, {'after': 0})
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual([m['text'] for m in r.json()['messages']], ['oi'])
+        self.conv.refresh_from_db()
+        self.assertEqual(self.conv.unread_for(self.bia), 0)
+
+    def test_sem_novidade(self):
+        r = self.client.get(self.url, {'after': self.ultima.id})
+        self.assertEqual(r.status_code, 200)  # sem If-None-Match não há 304
+        self.assertEqual(r.json(), {'messages': []})
+        etag = r['ETag']
+
+        with CaptureQueriesContext(connection) as consultas:
+            r = self.client.get(self.url, {'after': self.ultima.id}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(r.status_code, 304)
+        # só a linha da conversa: nenhuma consulta às mensagens
+        tabela = Message._meta.db_table
+        self.assertFalse([q for q in consultas if tabela in q['sql']])
+
+        self.conv.send(self.ana, 'e aí?')
+        r = self.client.get(self.url, {'after': self.ultima.id}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual([m['text'] for m in r.json()['messages']], ['e aí?'])
+        self.assertNotEqual(r['ETag'], etag)
+
+
+class HistoricoTests(TestCase):
+    """history() junta a tabela quente e o arquivo numa sequência só."""
+
+    def setUp(self):
+        ana = User.objects.create_user('ana')
+        bia = User.objects.create_user('bia')
+        self.conv = Conversation.for_users(ana, bia)
+        msgs = [self.conv.send(ana if i % 2 else bia, f'm{i}') for i in range(6)]
+        # as três primeiras ficam velhas e vão para o arquivo
+        antigo = timezone.now() - timedelta(days=400)
+        for i, m in enumerate(msgs[:3]):
+            Message.objects.filter(pk=m.pk).update(created_at=antigo + timedelta(minutes=i))
+        call_command('arquivar_mensagens', dias=365, stdout=StringIO())
+
+    def test_arquivo_recebeu_as_antigas(self):
+        self.assertEqual(list(ArchivedMessage.objects.order_by('id').values_list('text', flat=True)),
+                         ['m0', 'm1', 'm2'])
+        self.assertEqual(self.conv.messages.count(), 3)
+
+    def test_janela_atravessa_quente_e_arquivo(self):
+        msgs, mais = history(self.conv, 4)
+        self.assertEqual([m.text for m in msgs], ['m5', 'm4', 'm3', 'm2'])
+        self.assertTrue(mais)
+
+        msgs, mais = history(self.conv, 4, before_id=msgs[-1].id)
+        self.assertEqual([m.text for m in msgs], ['m1', 'm0'])
+        self.assertFalse(mais)
+
+    def test_tudo_de_uma_vez(self):
+        msgs, mais = history(self.conv, 10)
+        self.assertEqual([m.text for m in msgs], ['m5', 'm4', 'm3', 'm2', 'm1', 'm0'])
+        self.assertFalse(mais)
+
+
+@override_settings(CACHES=CACHE_LOCAL, CHAT_RATE_CAPACIDADE=3, CHAT_RATE_POR_SEGUNDO=1)
+class RateLimitTests(SimpleTestCase):
+    """Janela deslizante de envios (3 por janela de 3s nestes testes)."""
+
+    def setUp(self):
+        cache.clear()
+
+    def _no_instante(self, t):
+        return mock.patch('chat.ratelimit.time.time', return_value=t)
+
+    def test_rajada_ate_a_capacidade(self):
+        with self._no_instante(1000.0):
+            self.assertEqual([ratelimit.consumir(1)[0] for _ in range(4)], [True, True, True, False])
+            permitido, espera = ratelimit.consumir(1)
+            self.assertFalse(permitido)
+            self.assertGreater(espera, 0)
+            # o limite é por usuário
+            self.assertTrue(ratelimit.consumir(2)[0])
+
+    def test_janela_anterior_pesa_pelo_que_ainda_cobre(self):
+        with self._no_instante(1000.0):  # janela 333 (999-1002)
+            for _ in range(3):
+                ratelimit.consumir(1)
+        with self._no_instante(1004.9):  # janela 334, quase no fim: a anterior pesa ~3%
+            self.assertEqual([ratelimit.consumir(1)[0] for _ in range(3)], [True, True, False])
+
+    def test_rajada_paralela_nao_passa_do_limite(self):
+        resultados = []
+
+        def enviar():
+            resultados.append(ratelimit.consumir(1)[0])
+
+        with self._no_instante(1000.0):
+            threads = [threading.Thread(target=enviar) for _ in range(20)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        self.assertEqual(resultados.count(True), 3)
@@ -0,0 +1,44 @@
+"""
+Total de mensagens não lidas por usuário (badge do cabeçalho), em cache.
+
+O valor vem da soma dos contadores por lado das conversas (a_unread /
+b_unread) — uma query só, pelos índices de user_a/user_b — e fica no cache.
+Envio incrementa o total do destinatário; leitura apaga a chave (o próximo
+acesso recalcula), porque o quanto foi lido só o banco sabe com certeza.
+"""
+from django.core.cache import cache
+from django.db.models import Case, F, Q, Sum, When
+from django.db.models.functions import Coalesce
+
+TIMEOUT = 60 * 60
+
+
+def _chave(user_id):
+    return f"chat:nao_lidas:{user_id}"
+
+
+def total(user):
+    if not getattr(user, "pk", None):
+        return 0
+    valor = cache.get(_chave(user.pk))
+    if valor is None:
+        from .models import Conversation
+        valor = (Conversation.objects
+                 .filter(Q(user_a_id=user.pk) | Q(user_b_id=user.pk))
+                 .aggregate(n=Coalesce(Sum(Case(
+                     When(user_a_id=user.pk, then=F("a_unread")),
+                     default=F("b_unread"),
+                 )), 0))["n"])
+        cache.set(_chave(user.pk), valor, TIMEOUT)
+    return valor
+
+
+def incrementar(user_id):
+    try:
+        cache.incr(_chave(user_id))
+    except ValueError:
+        pass  # não está no cache: será calculado no próximo acesso
+
+
+def invalidar(user_id):
+    cache.delete(_chave(user_id))
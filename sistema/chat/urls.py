@@ -7,5 +7,9 @@ urlpatterns = [
     path('', views.inbox, name='inbox'),
     path('iniciar/<int:pet_id>/', views.iniciar_chat_com_dono, name='iniciar-chat-com-dono'),
     path('<str:username>/', views.thread_by_username, name='thread'),
+    path('api/unread/', views.api_unread, name='api-unread'),
     path('api/<str:username>/since/', views.api_thread_since, name='api-thread-since'),
+    path('api/<str:username>/older/', views.api_thread_older, name='api-thread-older'),
+    path('api/<str:username>/send/', views.api_send, name='api-send'),
+    path('api/<str:username>/stream/', views.stream_thread, name='api-thread-stream'),
 ]
@@ -15,58 +15,32 @@ def iniciar_chat_com_dono(request, pet_id):
         return redirect(pet.get_absolute_url())
     # Redireciona para o chat com o dono
     return redirect('chat:thread', username=dono.username)
+import json
+import math
+
+from asgiref.sync import sync_to_async
 from django.contrib.auth import get_user_model
-from django.db.models import Q, Max, Count
-from django.http import JsonResponse, Http404
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models import F, Q
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse, Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.contrib import messages
 from django.utils.dateparse import parse_datetime
-from django.utils.timezone import now
-from django.templatetags.static import static
+from django.views.decorators.http import require_POST
+
+from AmigoFiel.cartoes import cartao, cartoes
 
-from .models import Conversation, Message
+from . import ratelimit, unread
+from .models import Conversation, history
+from .pubsub import canal_da_conversa, get_broker, publicar_mensagem
 
 User = get_user_model()
 
 
 def get_user_display_info(user):
-    """Retorna informações de exibição do usuário (nome, avatar, tipo)"""
-    info = {
-        'username': user.username,
-        'name': user.username,
-        'avatar_url': static('img/defaults/avatar_comum.png'),
-        'type': 'comum',
-        'location': None,
-    }
-    
-    if hasattr(user, 'perfil_empresa') and user.perfil_empresa:
-        perfil = user.perfil_empresa
-        info['name'] = perfil.razao_social
-        info['type'] = 'empresa'
-        info['location'] = perfil.cidade if perfil.cidade else None
-        if perfil.foto:
-            info['avatar_url'] = perfil.foto.url
-        else:
-            info['avatar_url'] = static('img/defaults/avatar_empresa.png')
-    elif hasattr(user, 'perfil_ong') and user.perfil_ong:
-        perfil = user.perfil_ong
-        info['name'] = perfil.nome_fantasia
-        info['type'] = 'ong'
-        info['location'] = perfil.cidade if perfil.cidade else None
-        if perfil.foto:
-            info['avatar_url'] = perfil.foto.url
-        else:
-            info['avatar_url'] = static('img/defaults/avatar_ong.png')
-    elif hasattr(user, 'perfil_comum') and user.perfil_comum:
-        perfil = user.perfil_comum
-        # UsuarioComum não tem nome_completo, usa apenas username
-        info['name'] = user.username
-        info['type'] = 'comum'
-        info['location'] = perfil.cidade if perfil.cidade else None
-        if perfil.foto:
-            info['avatar_url'] = perfil.foto.url
-    
-    return info
+    """Retorna informações de exibição do usuário (nome, avatar, tipo) — do cartão em cache."""
+    return cartao(user)
 
 
 @login_required
@@ -75,61 +49,55 @@ def inbox(request):
     filter_type = request.GET.get('type', 'all')  # all, empresa, ong, comum
     filter_status = request.GET.get('status', 'all')  # all, unread, read
     search_query = request.GET.get('q', '').strip()
-    
-    conversations = (Conversation.objects
-                    .filter(Q(user_a=request.user) | Q(user_b=request.user))
-                    .annotate(last_ts=Max('messages__created_at'))
-                    .prefetch_related('messages')
-                    .order_by('-last_ts', '-last_message_at', '-updated_at'))
-    
-    # Preparar dados para o template
+
+    # Uma query só: última mensagem, não lidas e perfil do outro vêm anotados
+    conversations = Conversation.objects.do_usuario(request.user).com_resumo(request.user)
+
+    # Filtros aplicados no SQL
+    if filter_type in ('empresa', 'ong', 'comum'):
+        conversations = conversations.filter(other_type=filter_type)
+    if filter_status == 'unread':
+        conversations = conversations.filter(unread_count__gt=0)
+    elif filter_status == 'read':
+        conversations = conversations.filter(unread_count=0)
+    if search_query:
+        conversations = conversations.filter(
+            Q(other_name__icontains=search_query) | Q(other_username__icontains=search_query)
+        )
+
+    conversations = conversations.order_by(
+        F('last_created_at').desc(nulls_last=True), '-last_message_at', '-updated_at'
+    )
+
+    # Preparar dados para o template (perfis do outro: cartões em lote, do cache)
+    conversations = list(conversations)
+    cards = cartoes([conv.other_id for conv in conversations])
     threads = []
     for conv in conversations:
-        other_user = conv.other_of(request.user)
-        other_info = get_user_display_info(other_user)
-        
-        # Última mensagem
-        last_msg = conv.messages.order_by('-created_at').first()
-        
-        # Contar mensagens não lidas
-        unread_count = conv.messages.filter(
-            read_at__isnull=True
-        ).exclude(sender=request.user).count()
-        
-        thread_data = {
+        other_info = cards.get(conv.other_id) or {}
+        last_msg = None
+        if conv.last_created_at:
+            last_msg = {
+                'text': conv.last_text,
+                'created_at': conv.last_created_at,
+                'sender': {'username': conv.last_sender_username},
+            }
+        threads.append({
             'id': conv.id,
-            'other_username': other_user.username,
-            'other_name': other_info['name'],
-            'other_avatar_url': other_info['avatar_url'],
-            'other_type': other_info['type'],
-            'other_location': other_info['location'],
+            'other_username': conv.other_username,
+            'other_name': other_info.get('name', conv.other_name),
+            'other_avatar_url': other_info.get('avatar_url'),
+            'other_type': other_info.get('type', conv.other_type),
+            'other_location': other_info.get('location'),
             'last_message': last_msg,
             'updated_at': conv.last_message_at or conv.updated_at,
-            'unread_count': unread_count,
-        }
-        
-        # Aplicar filtro por tipo
-        if filter_type != 'all' and other_info['type'] != filter_type:
-            continue
-        
-        # Aplicar filtro por status (não lidas/lidas)
-        if filter_status == 'unread' and unread_count == 0:
-            continue
-        elif filter_status == 'read' and unread_count > 0:
-            continue
-        
-        # Aplicar busca por nome/username
-        if search_query:
-            if (search_query.lower() not in other_info['name'].lower() and 
-                search_query.lower() not in other_user.username.lower()):
-                continue
-        
-        threads.append(thread_data)
-    
+            'unread_count': conv.unread_count,
+        })
+
     # Estatísticas para badges
     total_threads = len(threads)
     total_unread = sum(1 for t in threads if t['unread_count'] > 0)
-    
+
     context = {
         'threads': threads,
         'filter_type': filter_type,
@@ -138,66 +106,221 @@ def inbox(request):
         'total_threads': total_threads,
         'total_unread': total_unread,
     }
-    
+
     return render(request, 'chat/inbox.html', context)
 
 
+JANELA_MENSAGENS = 50  # mensagens exibidas ao abrir a conversa / por "carregar anteriores"
+
+
+def _mensagem_json(m):
+    return {
+        'id': m.id,
+        'sender': m.sender.username,
+        'text': m.text,
+        'created_at': m.created_at.isoformat()
+    }
+
+
+MAX_TEXTO = 5000
+
+
+def _enviar(sender, other, conv, text):
+    if conv is None:
+        conv = Conversation.for_users(sender, other)
+    msg = conv.send(sender, text)
+    # robust: broker fora do ar só loga — a mensagem já foi gravada e o
+    # polling a entrega; um 500 aqui faria o cliente reenviar (duplicada)
+    transaction.on_commit(lambda: publicar_mensagem(msg), robust=True)
+    return conv, msg
+
+
 @login_required
 def thread_by_username(request, username):
     if username == request.user.username:
         raise Http404("Não é possível conversar consigo mesmo.")
     other = get_object_or_404(User, username=username)
     other_info = get_user_display_info(other)
-    conv = Conversation.for_users(request.user, other)
+    # GET só lê: sem conversa ainda, mostra a thread vazia sem gravar nada
+    conv = Conversation.find(request.user, other)
 
-    # enviar mensagem
+    # enviar mensagem sem JS (o template usa api_send); a conversa nasce na primeira.
+    # Mesmas regras do api_send: texto longo demais é recusado, não cortado.
+    send_error, status = '', 200
     if request.method == 'POST':
         text = (request.POST.get('text') or '').strip()
-        if text:
-            msg = Message.objects.create(conversation=conv, sender=request.user, text=text)
-            conv.last_message_at = msg.created_at
-            conv.save(update_fields=['last_message_at'])
+        if len(text) > MAX_TEXTO:
+            send_error, status = f'Máximo de {MAX_TEXTO} caracteres.', 400
+        elif text:
+            permitido, _ = ratelimit.consumir(request.user.pk)
+            if permitido:
+                conv = _enviar(request.user, other, conv, text)[0]
+            else:
+                send_error, status = 'Muitas mensagens seguidas. Aguarde um pouco.', 429
         # Não faz redirect - renderiza diretamente para evitar atraso
 
-    # marcar mensagens recebidas como lidas
-    (conv.messages
-         .filter(read_at__isnull=True)
-         .exclude(sender=request.user)
-         .update(read_at=now()))
+    # só as últimas JANELA_MENSAGENS; as anteriores vêm sob demanda (api_thread_older)
+    messages, has_older = [], False
+    if conv is not None:
+        messages, has_older = history(conv, JANELA_MENSAGENS)
+        messages.reverse()
 
-    messages = conv.messages.select_related('sender')
+    # avança o cursor de leitura até a última mensagem exibida (uma linha)
+    if messages:
+        conv.mark_read_by(request.user, messages[-1].id)
     return render(request, 'chat/thread.html', {
         'conversation': conv,
         'messages': messages,
+        'has_older': has_older,
+        'send_error': send_error,
         'other': other,
         'other_info': other_info,
-    })
+    }, status=status)
 
 
 @login_required
 def api_thread_since(request, username):
-    """Endpoint simples para polling: retorna mensagens novas desde ?since=ISO"""
+    """
+    Endpoint de polling: mensagens novas depois de ?after=<id> (ou, legado,
+    ?since=ISO). Sem novidade olha só a linha da conversa (last_message_id /
+    ETag), sem consultar mensagens nem escrever nada: 304 se a requisição
+    for condicional (If-None-Match), senão 200 com a lista vazia.
+    """
     other = get_object_or_404(User, username=username)
-    conv = Conversation.for_users(request.user, other)
+    conv = Conversation.find(request.user, other)
 
-    since_str = request.GET.get('since')
-    since_dt = parse_datetime(since_str) if since_str else None
+    after = request.GET.get('after', '')
+    after_id = int(after) if after.isdigit() else None
+    etag = conv.etag if conv else 'W/"0-0"'
+    last_id = (conv.last_message_id if conv else None) or 0
+    if request.headers.get('If-None-Match') == etag:
+        resp = HttpResponseNotModified()
+        resp['ETag'] = etag
+        return resp
+
+    if conv is None or (after_id is not None and after_id >= last_id):
+        resp = JsonResponse({'messages': []})
+        resp['ETag'] = etag
+        return resp
 
     msgs = conv.messages.select_related('sender')
-    if since_dt:
-        msgs = msgs.filter(created_at__gt=since_dt)
+    if after_id is not None:
+        msgs = msgs.filter(id__gt=after_id).order_by('id')
+    else:
+        since_str = request.GET.get('since')
+        since_dt = parse_datetime(since_str) if since_str else None
+        if since_dt:
+            msgs = msgs.filter(created_at__gt=since_dt)
 
-    data = [{
-        'id': m.id,
-        'sender': m.sender.username,
-        'text': m.text,
-        'created_at': m.created_at.isoformat()
-    } for m in msgs]
+    data = [_mensagem_json(m) for m in msgs]
+
+    # avança o cursor de leitura até a última mensagem entregue
+    if data:
+        conv.mark_read_by(request.user, data[-1]['id'])
+
+    resp = JsonResponse({'messages': data})
+    resp['ETag'] = etag
+    return resp
+
+
+@login_required
+@require_POST
+def api_send(request, username):
+    """
+    Envia uma mensagem e devolve só ela em JSON (201). Limite por usuário em
+    janela deslizante (chat/ratelimit.py): estourou, 429 com Retry-After.
+    """
+    if username == request.user.username:
+        raise Http404("Não é possível conversar consigo mesmo.")
+    other = get_object_or_404(User, username=username)
+
+    text = (request.POST.get('text') or '').strip()
+    if not text:
+        return JsonResponse({'error': 'Mensagem vazia.'}, status=400)
+    if len(text) > MAX_TEXTO:
+        return JsonResponse({'error': f'Máximo de {MAX_TEXTO} caracteres.'}, status=400)
+
+    permitido, espera = ratelimit.consumir(request.user.pk)
+    if not permitido:
+        resp = JsonResponse({'error': 'Muitas mensagens seguidas. Aguarde um pouco.'}, status=429)
+        resp['Retry-After'] = str(math.ceil(espera))
+        return resp
+
+    _, msg = _enviar(request.user, other, Conversation.find(request.user, other), text)
+    return JsonResponse({'message': _mensagem_json(msg)}, status=201)
+
+
+@login_required
+def api_thread_older(request, username):
+    """
+    "Carregar anteriores": até JANELA_MENSAGENS mensagens antes de ?before=<id>,
+    por keyset (created_at, id) — usa o índice msg_conv_created_id_idx (e o do
+    arquivo, quando a conversa chega às mensagens arquivadas).
+    """
+    other = get_object_or_404(User, username=username)
+    conv = Conversation.find(request.user, other)
+
+    try:
+        before = int(request.GET.get('before', ''))
+    except ValueError:
+        return JsonResponse({'error': 'before inválido'}, status=400)
+    if conv is None:
+        return JsonResponse({'messages': [], 'has_more': False})
+
+    msgs, has_more = history(conv, JANELA_MENSAGENS, before_id=before)
+    msgs.reverse()
+    return JsonResponse(
+        {'messages': [_mensagem_json(m) for m in msgs], 'has_more': has_more},
+        json_dumps_params={'separators': (',', ':')},
+    )
+
+
+@login_required
+def api_unread(request):
+    """Total de não lidas do usuário (badge do cabeçalho), vindo do cache."""
+    resp = JsonResponse({'unread': unread.total(request.user)})
+    resp['Cache-Control'] = 'private, no-cache'
+    return resp
+
+
+SSE_HEARTBEAT = 25  # segundos; mantém proxies/navegador com a conexão aberta
+
+
+def _marcar_lida_ate(conversation_id, user, message_id):
+    conv = Conversation.objects.filter(pk=conversation_id).first()
+    if conv:
+        conv.mark_read_by(user, message_id)
+
+
+@login_required
+async def stream_thread(request, username):
+    """
+    Server-Sent Events: empurra as mensagens novas da conversa assim que são
+    publicadas (chat/pubsub.py). Aba ociosa não toca no banco. Fora do ASGI
+    (runserver/WSGI) responde 204 e o navegador fica no polling.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    user = await request.auser()
+    other = await User.objects.filter(username=username).only('id').afirst()
+    if other is None or other.pk == user.pk:
+        raise Http404()
+    canal = canal_da_conversa(user.pk, other.pk)
 
-    # marca como lidas as recebidas
-    (conv.messages
-         .filter(read_at__isnull=True)
-         .exclude(sender=request.user)
-         .update(read_at=now()))
+    async def eventos():
+        async with get_broker().assinar(canal) as assinatura:
+            yield 'retry: 5000\n\n'
+            while True:
+                payload = await assinatura.receber(timeout=SSE_HEARTBEAT)
+                if payload is None:
+                    yield ': ping\n\n'
+                    continue
+                if payload['sender'] != user.username:
+                    # a aba está aberta: conta como lida
+                    await sync_to_async(_marcar_lida_ate)(payload['conversation'], user, payload['id'])
+                yield f"id: {payload['id']}\nevent: message\ndata: {json.dumps(payload)}\n\n"
 
-    return JsonResponse({'messages': data})
+    resp = StreamingHttpResponse(eventos(), content_type='text/event-stream')
+    resp['Cache-Control'] = 'no-cache'
+    resp['X-Accel-Buffering'] = 'no'  # nginx: não bufferizar o stream
+    return resp
@@ -3,6 +3,10 @@ ASGI config for sistema project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+O chat em tempo real (SSE em chat.views.stream_thread) precisa rodar sob ASGI,
+ex.: ``uvicorn sistema.asgi:application``. Sob WSGI o stream responde 204 e as
+páginas de conversa continuam no polling.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
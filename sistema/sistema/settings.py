@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -55,6 +56,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'AmigoFiel',
     'chat',
     ]
@@ -82,6 +84,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'AmigoFiel.context_processors.perfis_flags',
+                'chat.context_processors.chat_nao_lidas',
             ],
         },
     },
@@ -109,6 +112,38 @@ DATABASES = {
 }
 
 
+# Cache
+# Padrão: arquivos em disco (funciona offline e é compartilhado pelos workers da máquina).
+# Defina REDIS_URL (ex.: redis://127.0.0.1:6379/0) para usar Redis.
+REDIS_URL = os.getenv('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_DIR', os.path.join(tempfile.gettempdir(), 'amigofiel_cache')),
+        }
+    }
+
+# Chat em tempo real (SSE via ASGI): pub/sub que entrega as mensagens novas.
+# MemoryBroker só alcança conexões do mesmo processo; com vários workers use Redis.
+CHAT_PUBSUB_BACKEND = os.getenv(
+    'CHAT_PUBSUB_BACKEND',
+    'chat.pubsub.RedisBroker' if REDIS_URL else 'chat.pubsub.MemoryBroker',
+)
+# Mensagens mais antigas que isso vão para o arquivo (manage.py arquivar_mensagens)
+CHAT_ARQUIVO_DIAS = int(os.getenv('CHAT_ARQUIVO_DIAS', '365'))
+# Envio de mensagens: até 10 por janela deslizante de 20s (10 / 0.5) por usuário (chat/ratelimit.py)
+CHAT_RATE_CAPACIDADE = int(os.getenv('CHAT_RATE_CAPACIDADE', '10'))
+CHAT_RATE_POR_SEGUNDO = float(os.getenv('CHAT_RATE_POR_SEGUNDO', '0.5'))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -163,3 +198,38 @@ LOGOUT_REDIRECT_URL = '/login/'
 # MEDIA (uploads de usuários)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Uploads gravados por SHA-256 (AmigoFiel/storage.py): arquivos repetidos
+# ocupam disco uma vez só; os órfãos saem com manage.py limpar_midia.
+STORAGES = {
+    'default': {'BACKEND': 'AmigoFiel.storage.ArmazenamentoPorConteudo'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+# Entrega de /media/ (AmigoFiel/midia.py). Atrás do nginx use 'x-accel' com uma
+# location interna apontando para MEDIA_ROOT; no Apache, 'x-sendfile'.
+MEDIA_SENDFILE = os.getenv('MEDIA_SENDFILE', '')  # '', 'x-accel' ou 'x-sendfile'
+MEDIA_ACCEL_PREFIX = os.getenv('MEDIA_ACCEL_PREFIX', '/_media_interno/')
+# Cache de arquivos sem hash no nome (uploads antigos); os com hash são immutable
+MEDIA_CACHE_SEGUNDOS = int(os.getenv('MEDIA_CACHE_SEGUNDOS', '3600'))
+
+# Derivados de imagem (AmigoFiel/imagens.py): lado maior, em px, de cada tamanho.
+# Os cards mostram 56–300px; os tamanhos já contam telas 2x.
+IMAGENS_TAMANHOS = {
+    'mini': 128,
+    'card': 600,
+    'grande': 1280,
+}
+IMAGENS_FORMATO = os.getenv('IMAGENS_FORMATO', 'WEBP')  # WEBP ou JPEG
+IMAGENS_QUALIDADE = int(os.getenv('IMAGENS_QUALIDADE', '80'))
+# Originais maiores que isso são reduzidos pelo worker (manage.py processar_imagens)
+IMAGENS_LADO_MAXIMO = int(os.getenv('IMAGENS_LADO_MAXIMO', '2560'))
+
+# Limites de upload de imagem, conferidos pelo form antes de decodificar
+# (tamanho do arquivo e megapixels lidos só do cabeçalho). O mesmo limite de
+# pixels vale para o Pillow no processo todo (Image.MAX_IMAGE_PIXELS).
+IMAGENS_MAX_BYTES = int(os.getenv('IMAGENS_MAX_BYTES', str(10 * 1024 * 1024)))
+IMAGENS_MAX_PIXELS = int(os.getenv('IMAGENS_MAX_PIXELS', str(40_000_000)))
+# Fotos de Pet e Produto já são gravadas reduzidas a este lado maior
+IMAGENS_UPLOAD_LADO_MAXIMO = int(os.getenv('IMAGENS_UPLOAD_LADO_MAXIMO', '2048'))
+# Uploads acima disso vão direto para arquivo temporário em disco, não para a memória
+FILE_UPLOAD_MAX_MEMORY_SIZE = 1024 * 1024
+FILE_UPLOAD_TEMP_DIR = os.getenv('FILE_UPLOAD_TEMP_DIR') or None
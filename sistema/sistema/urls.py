@@ -5,7 +5,7 @@ from AmigoFiel import views as amigofiel_views
 from django.contrib.auth.views import LogoutView
 from django.views.generic import RedirectView
 from django.conf import settings
-from django.conf.urls.static import static
+from AmigoFiel.midia import servir_midia
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -23,4 +23,5 @@ urlpatterns = [
     path('AmigoFiel/', RedirectView.as_view(url='/', permanent=False)),
 ]
 
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# Mídia enviada pelos usuários: ETag/304, Range, cache immutable e sendfile
+urlpatterns.insert(0, path(f"{settings.MEDIA_URL.strip('/')}/<path:caminho>", servir_midia, name='media'))